@@ -0,0 +1,766 @@
+#!/usr/bin/env python3
+'''
+benchmark the full compare path against locally served fixtures
+
+synthetic fixtures are generated deterministically (a tracker json, source
+packages in both 3.0 (quilt) and 1.0 diff.gz format, canned BTS bugs) and the
+snapshot, BTS SOAP and security tracker responses are served from a local
+http server so no network access is required.  Results are printed as one json object
+per line.
+'''
+import gzip
+import hashlib
+import io
+import json
+import logging
+import os
+import random
+import resource
+import shutil
+import statistics
+import subprocess
+import sys
+import tarfile
+import tempfile
+import threading
+import time
+import xml.etree.ElementTree as ET
+from argparse import ArgumentParser
+from contextlib import redirect_stdout
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import unquote
+
+import debianbts
+
+from debcompare import compare, secinfo, trackerscrape, transport
+
+
+RELEASES = ['jessie', 'stretch', 'buster', 'bullseye', 'bookworm']
+UPSTREAM_VERSION = '1.0'
+OLD_VERSION = '1.0-1+deb9u1'
+NEW_VERSION = '1.0-1+deb9u2'
+BENCH_DATE = datetime(2018, 1, 1, tzinfo=timezone.utc)
+SOAPENV = 'http://schemas.xmlsoap.org/soap/envelope/'
+SOAPENC = 'http://schemas.xmlsoap.org/soap/encoding/'
+XSD = 'http://www.w3.org/2001/XMLSchema'
+XSI = 'http://www.w3.org/2001/XMLSchema-instance'
+# run the cli in a fresh interpreter pointed at the fixture server
+CLI_SCRIPT = '''
+import sys
+import debianbts
+from debcompare import compare, trackerscrape
+compare.SNAPSHOT_URL = sys.argv[1]
+trackerscrape.TRACKER_URI = sys.argv[1] + '/tracker/{bug}'
+debianbts.set_soap_location(sys.argv[1] + '/soap')
+sys.argv = ['debcompare'] + sys.argv[2:]
+compare.main()
+'''
+
+
+class FixtureServer:
+    '''serve canned snapshot and security tracker responses over http'''
+
+    def __init__(self):
+        self.responses = {}
+        self.bugs = {}
+        self.requests = 0
+        responses = self.responses
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            '''lookup the request path in the canned responses'''
+
+            def do_GET(self):  # pylint: disable=invalid-name
+                '''return a canned response or 404'''
+                server.requests += 1
+                response = responses.get(unquote(self.path))
+                if response is None:
+                    self.send_error(404)
+                    return
+                content_type, body = response
+                self.send_response(200)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_POST(self):  # pylint: disable=invalid-name
+                '''return the canned SOAP response for the requested method'''
+                server.requests += 1
+                length = int(self.headers.get('Content-Length', 0))
+                request = ET.fromstring(self.rfile.read(length))
+                method = request.find('{{{}}}Body/*'.format(SOAPENV))
+                body = server.soap(
+                    method.tag.rsplit('}', 1)[-1],
+                    [item.text for item in method.iter('item')],
+                )
+                if body is None:
+                    self.send_error(404)
+                    return
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/xml; charset="utf-8"')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):  # pylint: disable=arguments-differ
+                '''keep the benchmark output clean'''
+
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = 'http://127.0.0.1:{}'.format(self.httpd.server_address[1])
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    def add(self, path, body, content_type='application/octet-stream'):
+        '''register a canned response'''
+        if isinstance(body, str):
+            body = body.encode()
+        self.responses[path] = (content_type, body)
+
+    def add_snapshot_package(self, name, version, files):
+        '''register the fileinfo and file responses for a source package'''
+        fileinfo = {'fileinfo': {}, 'package': name, 'version': version, 'result': []}
+        for path in files:
+            with open(path, 'rb') as file_stream:
+                content = file_stream.read()
+            sha = hashlib.sha1(content).hexdigest()
+            fileinfo['fileinfo'][sha] = [
+                {'name': os.path.basename(path), 'archive_name': 'debian'}
+            ]
+            fileinfo['result'].append({'hash': sha})
+            self.add('/file/{}'.format(sha), content)
+        self.add(
+            '/mr/package/{}/{}/srcfiles?fileinfo=1'.format(name, version),
+            json.dumps(fileinfo),
+            'application/json',
+        )
+
+    def add_bug(self, bug_num, package, date, subject):
+        '''register a canned bug for the SOAP get_bugs and get_status calls'''
+        self.bugs[bug_num] = {
+            'bug_num': bug_num, 'package': package, 'date': date, 'subject': subject,
+        }
+
+    def soap(self, method, args):
+        '''return the SOAP response for the get_bugs or get_status call'''
+        if method == 'get_bugs':
+            # the keyword arguments are sent as a flat key, value array
+            package = dict(zip(args[::2], args[1::2])).get('package')
+            return soap_response(method, [
+                bug_num for bug_num, bug in self.bugs.items()
+                if bug['package'] == package
+            ])
+        if method == 'get_status':
+            return soap_response(method, {
+                int(bug_num): bug_status(self.bugs[int(bug_num)])
+                for bug_num in args if int(bug_num) in self.bugs
+            })
+        return None
+
+    def start(self):
+        '''start serving in a background thread'''
+        self.thread.start()
+
+    def stop(self):
+        '''stop the server'''
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+def _soap_value(parent, name, value):
+    '''append value to parent using the debbugs SOAP encoding'''
+    element = ET.SubElement(parent, name)
+    if isinstance(value, dict):
+        element.set('{{{}}}type'.format(XSI), 'apachens:Map')
+        for key, item_value in value.items():
+            item = ET.SubElement(element, 'item')
+            _soap_value(item, 'key', key)
+            struct = ET.SubElement(item, 'value')
+            for field, field_value in item_value.items():
+                _soap_value(struct, field, field_value)
+    elif isinstance(value, list):
+        element.set('{{{}}}type'.format(XSI), 'soapenc:Array')
+        for item in value:
+            _soap_value(element, 'item', item)
+    else:
+        element.set('{{{}}}type'.format(XSI), 'xsd:string')
+        element.text = str(value)
+
+
+def soap_response(method, value):
+    '''return the debbugs SOAP response body for method returning value'''
+    envelope = ET.Element('{{{}}}Envelope'.format(SOAPENV))
+    body = ET.SubElement(envelope, '{{{}}}Body'.format(SOAPENV))
+    response = ET.SubElement(body, '{}Response'.format(method))
+    _soap_value(response, 's-gensym3', value)
+    return ET.tostring(envelope)
+
+
+def bug_status(bug):
+    '''return the get_status fields for a canned bug'''
+    timestamp = int(bug['date'].timestamp())
+    status = {
+        field: '' for field in [
+            'originator', 'msgid', 'owner', 'summary', 'location', 'pending',
+            'forwarded', 'tags', 'done', 'archived', 'unarchived', 'mergedwith',
+            'blockedby', 'blocks', 'affects',
+        ]
+    }
+    status.update({
+        'bug_num': bug['bug_num'],
+        'subject': bug['subject'],
+        'package': bug['package'],
+        'source': bug['package'],
+        'severity': 'normal',
+        'date': timestamp,
+        'log_modified': timestamp,
+        'found_versions': [],
+        'fixed_versions': [],
+    })
+    return status
+
+
+def make_tracker(path, packages, cves, rng):
+    '''write a synthetic security tracker json file'''
+    data = {}
+    cve_num = 0
+    for package_num in range(packages):
+        package = 'pkg{}'.format(package_num)
+        data[package] = {}
+        for _ in range(rng.randint(1, cves * 2)):
+            cve_num += 1
+            data[package]['CVE-2018-{}'.format(cve_num)] = make_tracker_cve(
+                package, rng
+            )
+    return write_tracker(path, data)
+
+
+def make_tracker_cve(package, rng, fixed_version=None):
+    '''return a synthetic tracker entry for a single CVE'''
+    releases = {}
+    for release in rng.sample(RELEASES, rng.randint(1, len(RELEASES))):
+        if fixed_version is not None or rng.random() < 0.8:
+            version = fixed_version or '{}.{}-{}'.format(
+                rng.randint(0, 9), rng.randint(0, 30), rng.randint(1, 5)
+            )
+            releases[release] = {
+                'status': 'resolved',
+                'repositories': {release: version},
+                'fixed_version': version,
+                'urgency': rng.choice(['low', 'medium', 'high']),
+            }
+        else:
+            releases[release] = {
+                'status': 'open',
+                'repositories': {release: '1.0-1'},
+                'urgency': 'unimportant',
+            }
+    return {
+        'scope': rng.choice(['local', 'remote']),
+        'description': 'synthetic vulnerability in {} {}'.format(
+            package, ' '.join(rng.choice(['heap', 'overflow', 'leak', 'crash'])
+                              for _ in range(12))
+        ),
+        'releases': releases,
+    }
+
+
+def write_tracker(path, data):
+    '''serialise tracker data and return the number of bytes written'''
+    with open(path, 'w') as file_stream:
+        json.dump(data, file_stream)
+    return os.path.getsize(path)
+
+
+def make_changelog(name, versions):
+    '''return a debian/changelog for versions, newest first'''
+    entries = []
+    for num, version in enumerate(versions):
+        date = BENCH_DATE - timedelta(days=30 * num)
+        entries.append(
+            '{} ({}) stretch-security; urgency=medium\n\n'
+            '  * Fix CVE-2018-{} and CVE-2018-{}\n'
+            '  * Backport upstream patch for issue {}\n\n'
+            ' -- Bench Maintainer <bench@example.org>  {}\n'.format(
+                name, version, 1000 + num, 2000 + num, num,
+                format_datetime(date),
+            )
+        )
+    return '\n'.join(entries)
+
+
+def _tar_add(tar, name, content):
+    '''add content as a regular file called name to tar'''
+    if isinstance(content, str):
+        content = content.encode()
+    info = tarfile.TarInfo(name)
+    info.size = len(content)
+    info.mtime = int(BENCH_DATE.timestamp())
+    tar.addfile(info, io.BytesIO(content))
+
+
+def make_orig_tarball(directory, name, files, rng):
+    '''write an upstream tarball with a number of source files'''
+    path = os.path.join(directory, '{}_{}.orig.tar.gz'.format(name, UPSTREAM_VERSION))
+    if os.path.isfile(path):
+        return path
+    with tarfile.open(path, 'w:gz') as tar:
+        for num in range(files):
+            lines = [
+                'int function_{}_{}(int arg) {{ return arg * {}; }}'.format(
+                    num, line, rng.randint(0, 1 << 16))
+                for line in range(rng.randint(50, 400))
+            ]
+            _tar_add(
+                tar,
+                '{}-{}/src/file{}.c'.format(name, UPSTREAM_VERSION, num),
+                '\n'.join(lines),
+            )
+    return path
+
+
+def _patch(num):
+    '''return a small quilt patch'''
+    return (
+        '--- a/src/file{0}.c\n+++ b/src/file{0}.c\n@@ -1,1 +1,1 @@\n'
+        '-int function_{0}_0(int arg) {{ return arg; }}\n'
+        '+int function_{0}_0(int arg) {{ return arg > 0 ? arg : 0; }}\n'.format(num)
+    )
+
+
+def make_debian_tarball(directory, name, versions):
+    '''write a 3.0 (quilt) debian tarball for the newest of versions'''
+    path = os.path.join(directory, '{}_{}.debian.tar.xz'.format(name, versions[0]))
+    patches = ['CVE-2018-{}.patch'.format(1000 + num) for num in range(len(versions))]
+    with tarfile.open(path, 'w:xz') as tar:
+        _tar_add(tar, 'debian/changelog', make_changelog(name, versions))
+        _tar_add(tar, 'debian/control', 'Source: {}\nSection: net\n'.format(name))
+        _tar_add(tar, 'debian/rules', '#!/usr/bin/make -f\n%:\n\tdh $@\n')
+        _tar_add(tar, 'debian/patches/series', '\n'.join(patches) + '\n')
+        for num, patch in enumerate(patches):
+            _tar_add(tar, 'debian/patches/{}'.format(patch), _patch(num))
+    return path
+
+
+def make_diff_gz(directory, name, versions):
+    '''write a 1.0 format diff.gz carrying the debian directory and patches'''
+    path = os.path.join(directory, '{}_{}.diff.gz'.format(name, versions[0]))
+    sections = []
+    for filename, content in [
+        ('debian/control', 'Source: {}\nSection: net\n'.format(name)),
+        ('debian/changelog', make_changelog(name, versions)),
+        ('debian/rules', '#!/usr/bin/make -f\n%:\n\tdh $@\n'),
+    ]:
+        lines = content.split('\n')
+        sections.append(
+            '--- {0}-{1}.orig/{2}\n+++ {0}-{1}/{2}\n@@ -0,0 +1,{3} @@\n{4}\n'.format(
+                name, UPSTREAM_VERSION, filename, len(lines),
+                '\n'.join('+' + line for line in lines),
+            )
+        )
+    # each version also patches an upstream file, like the quilt patches
+    sections.extend(_patch(num) for num in range(len(versions)))
+    with gzip.open(path, 'wb') as file_stream:
+        file_stream.write(''.join(sections).encode())
+    return path
+
+
+def make_dsc(directory, name, version, files):
+    '''write a dsc file referencing files'''
+    path = os.path.join(directory, '{}_{}.dsc'.format(name, version))
+    md5, sha256 = [], []
+    for file_path in files:
+        with open(file_path, 'rb') as file_stream:
+            content = file_stream.read()
+        basename = os.path.basename(file_path)
+        md5.append(' {} {} {}'.format(
+            hashlib.md5(content).hexdigest(), len(content), basename))
+        sha256.append(' {} {} {}'.format(
+            hashlib.sha256(content).hexdigest(), len(content), basename))
+    is_quilt = any(f.endswith('.debian.tar.xz') for f in files)
+    with open(path, 'w') as file_stream:
+        file_stream.write(
+            'Format: {}\nSource: {}\nVersion: {}\nChecksums-Sha256:\n{}\n'
+            'Files:\n{}\n'.format(
+                '3.0 (quilt)' if is_quilt else '1.0', name, version,
+                '\n'.join(sha256), '\n'.join(md5),
+            )
+        )
+    return path
+
+
+def make_source_package(directory, name, version, history, fmt, rng, files):
+    '''
+    write a source package to directory and return the list of its files,
+    the dsc first
+    '''
+    orig = make_orig_tarball(directory, name, files, rng)
+    versions = [version] + history
+    if fmt == 'quilt':
+        debian = make_debian_tarball(directory, name, versions)
+    else:
+        debian = make_diff_gz(directory, name, versions)
+    dsc = make_dsc(directory, name, version, [orig, debian])
+    return [dsc, orig, debian]
+
+
+def make_debdiff(size, rng):
+    '''return a synthetic debdiff output of roughly size bytes'''
+    lines = []
+    total = 0
+    while total < size:
+        num = rng.randint(0, 1 << 20)
+        chunk = [
+            'diff -Nru old/src/file{0}.c new/src/file{0}.c'.format(num),
+            '--- old/src/file{}.c'.format(num),
+            '+++ new/src/file{}.c'.format(num),
+            '@@ -1,3 +1,3 @@',
+            ' int unchanged_{}(void);'.format(num),
+            '-int function_{0}(int arg) {{ return arg; }}'.format(num),
+            '+int function_{0}(int arg) {{ return arg > 0 ? arg : 0; }}'.format(num),
+        ]
+        total += sum(len(line) + 1 for line in chunk)
+        lines.extend(chunk)
+    return '\n'.join(lines).encode()
+
+
+def current_rss():
+    '''return the current resident set size in bytes'''
+    try:
+        with open('/proc/self/statm', 'r') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError):
+        # ru_maxrss is in KiB on linux
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def timeit(func, repeat):
+    '''call func repeat times and return the durations'''
+    durations = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        durations.append(time.perf_counter() - start)
+    return durations
+
+
+def result(name, durations, **extra):
+    '''build a result record'''
+    record = {
+        'benchmark': name,
+        'runs': len(durations),
+        'min': round(min(durations), 6),
+        'median': round(statistics.median(durations), 6),
+        'max': round(max(durations), 6),
+    }
+    record.update(extra)
+    return record
+
+
+class Bench:
+    '''build the fixtures and run the benchmarks'''
+
+    def __init__(self, args):
+        self.args = args
+        self.rng = random.Random(args.seed)
+        self.logger = logging.getLogger('debcompare.Bench')
+        self.fixtures_dir = args.fixtures_dir or tempfile.mkdtemp(
+            prefix='debcompare-fixtures-')
+        self.working_dir = tempfile.mkdtemp(prefix='debcompare-bench-')
+        self.server = FixtureServer()
+        self.tracker_path = os.path.join(self.fixtures_dir, 'cve.json')
+        self.packages = {'benchquilt': 'quilt', 'benchdiff': 'diff'}
+        self.results = []
+
+    def emit(self, record):
+        '''store and print a result record'''
+        self.results.append(record)
+        line = json.dumps(record, sort_keys=True)
+        print(line)
+        if self.args.output:
+            with open(self.args.output, 'a') as output:
+                output.write(line + '\n')
+
+    def setup(self):
+        '''generate the fixtures and start the fixture server'''
+        os.makedirs(self.fixtures_dir, exist_ok=True)
+        if not os.path.isfile(self.tracker_path):
+            make_tracker(self.tracker_path, self.args.packages, self.args.cves,
+                         self.rng)
+        with open(self.tracker_path, 'r') as file_stream:
+            tracker = json.load(file_stream)
+
+        for name, fmt in self.packages.items():
+            tracker[name] = {}
+            for num in range(self.args.cves):
+                cve = 'CVE-2019-{}{}'.format(len(tracker), num)
+                tracker[name][cve] = make_tracker_cve(name, self.rng, NEW_VERSION)
+                self.server.add(
+                    '/tracker/{}'.format(cve),
+                    '<html><body><h1>{0}</h1><h2>Notes</h2><pre>'
+                    '<a href="https://example.org/{0}">https://example.org/{0}</a>'
+                    '</pre></body></html>'.format(cve),
+                    'text/html',
+                )
+            for version, history in [
+                (OLD_VERSION, ['1.0-1']),
+                (NEW_VERSION, [OLD_VERSION, '1.0-1']),
+            ]:
+                files = make_source_package(
+                    self.fixtures_dir, name, version, history, fmt, self.rng,
+                    self.args.source_files,
+                )
+                self.server.add_snapshot_package(name, version, files)
+            for num in range(self.args.bugs):
+                self.server.add_bug(
+                    800000 + len(self.server.bugs), name,
+                    BENCH_DATE - timedelta(days=45 - num),
+                    'synthetic bug {}'.format(num),
+                )
+        write_tracker(self.tracker_path, tracker)
+
+        self.server.start()
+        compare.SNAPSHOT_URL = self.server.url
+        # the fixture server is local so don't rate limit it
+        transport.configure(rate_limits={'127.0.0.1': (1e6, 1e6)})
+        trackerscrape.TRACKER_URI = self.server.url + '/tracker/{bug}'
+        debianbts.set_soap_location(self.server.url + '/soap')
+
+    def seed_cache(self, name):
+        '''write a canned diff to the cache if debdiff is not installed'''
+        if not shutil.which(self.args.debdiff):
+            diff_path = os.path.join(
+                self.working_dir,
+                '{}_{}-{}.diff'.format(name, OLD_VERSION, NEW_VERSION),
+            )
+            compare.write_file(make_debdiff(self.args.diff_size, self.rng), diff_path)
+
+    def clear_cache(self):
+        '''remove everything from the working directory'''
+        shutil.rmtree(self.working_dir)
+        os.makedirs(self.working_dir)
+
+    def differ(self, name, fixed_cves=None):
+        '''return a Differ for the fixture package name'''
+        return compare.Differ(
+            name, OLD_VERSION, NEW_VERSION, fixed_cves, working_dir=self.working_dir,
+            debdiff=self.args.debdiff,
+        )
+
+    def bench_tracker(self):
+        '''time loading the tracker data and measure its memory footprint'''
+        size = os.path.getsize(self.tracker_path)
+        index_path = secinfo.index_path(self.tracker_path)
+
+        def load_cold():
+            if os.path.isfile(index_path):
+                os.remove(index_path)
+            return secinfo.PackagesCVE(self.tracker_path)
+
+        rss_before = current_rss()
+        packages_cve = load_cold()
+        rss_after = current_rss()
+        durations = timeit(load_cold, self.args.repeat)
+        self.emit(result(
+            'tracker_load_cold', durations, bytes=size,
+            rss_delta=rss_after - rss_before,
+            max_rss=resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024,
+            mb_per_second=round(size / min(durations) / 2 ** 20, 3),
+        ))
+        self.emit(result(
+            'tracker_load_warm',
+            timeit(lambda: secinfo.PackagesCVE(self.tracker_path), self.args.repeat),
+            index_bytes=os.path.getsize(index_path),
+        ))
+        self.emit(result(
+            'tracker_get_cves',
+            timeit(lambda: packages_cve.get_cves('benchquilt', NEW_VERSION),
+                   self.args.repeat),
+        ))
+        return packages_cve
+
+    def bench_startup(self):
+        '''time the cli in a fresh interpreter against a warm cache'''
+        budget = self.args.startup_budget
+        durations = timeit(
+            lambda: subprocess.run(
+                [sys.executable, '-c', 'import debcompare.compare'], check=True),
+            self.args.repeat,
+        )
+        self.emit(result('cli_import', durations))
+
+        for name in self.packages:
+            self.seed_cache(name)
+            shutil.copy(self.tracker_path, os.path.join(self.working_dir, 'cve.json'))
+            for extra in [[], ['--diff-only']]:
+                cmd = [sys.executable, '-c', CLI_SCRIPT, self.server.url,
+                       '--no-color', '-w', self.working_dir, '-o', OLD_VERSION,
+                       '-n', NEW_VERSION] + extra + [name]
+                # the first run warms the tracker index and notes
+                subprocess.run(cmd, check=True, stdout=subprocess.DEVNULL)
+                durations = timeit(
+                    lambda cmd=cmd: subprocess.run(
+                        cmd, check=True, stdout=subprocess.DEVNULL),
+                    self.args.repeat,
+                )
+                self.emit(result(
+                    'cli_warm', durations, package=name, diff_only=bool(extra),
+                    budget=budget, within_budget=min(durations) <= budget,
+                ))
+
+    def bench_package(self, name, packages_cve):
+        '''time the compare path for a single fixture package'''
+        cold = []
+        for _ in range(self.args.repeat):
+            self.clear_cache()
+            self.seed_cache(name)
+            requests = self.server.requests
+            cold.extend(timeit(lambda: self.differ(name), 1))
+        self.emit(result(
+            'differ_cold', cold, package=name,
+            http_requests=self.server.requests - requests,
+        ))
+
+        def bts_cold():
+            for suffix in ['bugs', 'secbugs']:
+                path = os.path.join(self.working_dir, '{}.{}'.format(name, suffix))
+                if os.path.isfile(path):
+                    os.remove(path)
+            differ = self.differ(name)
+            return differ.bugs, differ.security_bugs
+
+        requests = self.server.requests
+        self.emit(result(
+            'bts_cold', timeit(bts_cold, self.args.repeat), package=name,
+            http_requests=(self.server.requests - requests) // self.args.repeat,
+        ))
+        self.emit(result(
+            'differ_warm', timeit(lambda: self.differ(name), self.args.repeat),
+            package=name,
+        ))
+
+        def summary_cold():
+            for filename in os.listdir(self.working_dir):
+                if filename.endswith('.members'):
+                    os.remove(os.path.join(self.working_dir, filename))
+            return self.differ(name).summary
+
+        self.emit(result('summary_cold', timeit(summary_cold, self.args.repeat),
+                         package=name))
+        self.emit(result(
+            'summary_warm',
+            timeit(lambda: self.differ(name).summary, self.args.repeat),
+            package=name,
+        ))
+        self.emit(result(
+            'changelog_parse',
+            timeit(lambda: self.differ(name).new_package.changelog, self.args.repeat),
+            package=name,
+        ))
+
+        if shutil.which(self.args.debdiff):
+            durations = []
+            size = 0
+            for _ in range(self.args.repeat):
+                differ = self.differ(name)
+                os.remove(differ.diff_path)
+                differ._diff = None  # pylint: disable=protected-access
+                durations.extend(timeit(lambda: differ.diff, 1))
+                size = len(differ.diff or b'')
+            self.emit(result(
+                'debdiff', durations, package=name, bytes=size,
+                mb_per_second=round(size / min(durations) / 2 ** 20, 3),
+            ))
+        else:
+            self.emit({'benchmark': 'debdiff', 'package': name,
+                       'skipped': '{} not found'.format(self.args.debdiff)})
+
+        for phab in [False, True]:
+            fixed_cves = packages_cve.get_cves(name, NEW_VERSION)
+            differ = self.differ(name, fixed_cves)
+            size = len(differ.diff)
+
+            def render(differ=differ, phab=phab):
+                with redirect_stdout(io.StringIO()):
+                    differ.cli_report(color=False, phab=phab)
+
+            self.emit(result(
+                'report_cold', timeit(render, 1), package=name, phab=phab,
+                bytes=size,
+            ))
+            durations = timeit(render, self.args.repeat)
+            self.emit(result(
+                'report_warm', durations, package=name, phab=phab, bytes=size,
+                mb_per_second=round(size / min(durations) / 2 ** 20, 3),
+            ))
+
+    def run(self):
+        '''run all benchmarks'''
+        try:
+            self.setup()
+            packages_cve = self.bench_tracker()
+            for name in self.packages:
+                self.bench_package(name, packages_cve)
+            self.bench_startup()
+        finally:
+            self.server.stop()
+            shutil.rmtree(self.working_dir, ignore_errors=True)
+            if not self.args.fixtures_dir:
+                shutil.rmtree(self.fixtures_dir, ignore_errors=True)
+        return self.results
+
+
+def get_args():
+    '''return argparse object'''
+    parser = ArgumentParser(description=__doc__)
+    parser.add_argument(
+        '-r', '--repeat', type=int, default=5, help='number of runs per benchmark'
+    )
+    parser.add_argument(
+        '--packages', type=int, default=5000,
+        help='number of packages in the synthetic tracker data',
+    )
+    parser.add_argument(
+        '--cves', type=int, default=10,
+        help='average number of CVEs per package in the synthetic tracker data',
+    )
+    parser.add_argument(
+        '--bugs', type=int, default=50, help='number of canned BTS bugs'
+    )
+    parser.add_argument(
+        '--source-files', type=int, default=200,
+        help='number of files in the synthetic upstream tarball',
+    )
+    parser.add_argument(
+        '--diff-size', type=int, default=2 ** 20,
+        help='size of the canned diff used when debdiff is not installed',
+    )
+    parser.add_argument(
+        '--fixtures-dir',
+        help='keep the generated fixtures in this directory and reuse them',
+    )
+    parser.add_argument(
+        '--startup-budget', type=float, default=1.0,
+        help='fail if a warm cli run takes longer than this many seconds',
+    )
+    parser.add_argument('--debdiff', default='/usr/bin/debdiff')
+    parser.add_argument('--seed', type=int, default=1, help='random seed')
+    parser.add_argument('--output', help='also append results to this file')
+    parser.add_argument(
+        '-v', '--verbose', action='count', help='Add more to increase verbosity'
+    )
+    return parser.parse_args()
+
+
+def main():
+    '''the main function'''
+    args = get_args()
+    compare.set_log_level(args.verbose)
+    results = Bench(args).run()
+    if not all(record.get('within_budget', True) for record in results):
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+'''
+client for debcompared, it takes the same arguments as debcompare.compare and
+falls back to running the comparison locally if the daemon is not running
+'''
+import json
+import logging
+import os
+import socket
+import sys
+
+from debcompare import compare
+from debcompare.daemon import SOCKET_PATH
+
+
+def get_args():
+    '''return argparse object'''
+    parser = compare.get_parser()
+    parser.add_argument(
+        '-s', '--socket', default=SOCKET_PATH, help='the debcompared unix socket'
+    )
+    return parser.parse_args()
+
+
+def request(socket_path, args):
+    '''send the parsed arguments to the daemon and return the decoded response'''
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+        client.connect(socket_path)
+        client.sendall(json.dumps({'args': args}).encode() + b'\n')
+        with client.makefile('rb') as response:
+            return json.loads(response.readline())
+
+
+def main():
+    '''the main function'''
+    args = get_args()
+    compare.set_log_level(args.verbose)
+    logger = logging.getLogger('debcompare.Client')
+    # the daemon runs in a different directory
+    args.working_dir = os.path.abspath(args.working_dir)
+    if args.profile:
+        # the daemon process can't be profiled from here
+        logger.info('profiling, running locally')
+        compare.main(args)
+        return
+    request_args = {
+        key: value for key, value in vars(args).items()
+        if key not in ['socket', 'profile', 'profiler']
+    }
+    try:
+        response = request(args.socket, request_args)
+    except (FileNotFoundError, ConnectionRefusedError) as error:
+        logger.warning('unable to connect to %s (%s), running locally',
+                       args.socket, error)
+        compare.main(args)
+        return
+    sys.stdout.write(response['output'])
+    if 'error' in response:
+        logger.error('debcompared: %s', response['error'])
+    if 'timings' in response:
+        print(response['timings'], file=sys.stderr)
+    raise SystemExit(response['status'])
+
+
+if __name__ == "__main__":
+    main()
@@ -4,27 +4,29 @@ python module to compare two debian packages from a security prespective
 '''
 # we use python3 as xz is not supported in python2 tarfile
 import gzip
-import json
 import logging
 import lzma
 import os
 import pickle
+import sys
 import tarfile
+import time
 from argparse import ArgumentParser
 from datetime import datetime
+from functools import partial
 from re import search
 from subprocess import CalledProcessError, check_output
 
-import debianbts as bts
-
-from debian.changelog import Changelog
-from requests import get, Session
-from requests.adapters import HTTPAdapter, Retry
-
-from debcompare.secinfo import PackagesCVE, SECURITY_TRACKERDATA_URL
+# debianbts, debian.changelog, requests and fabulous are imported where they
+# are used so a warm run only pays for the stages it actually needs
+from debcompare import transport
+from debcompare.metrics import METRICS, PROFILERS, incr, profile, span
+from debcompare.secinfo import PackagesCVE, update_data_file
 
 
 SNAPSHOT_URL = 'http://snapshot.debian.org'
+# debianbts manages its own SOAP connections, we only rate limit them
+BTS_HOST = 'bugs.debian.org'
 
 
 class DownloadException(Exception):
@@ -43,6 +45,14 @@ class ExtentionNotFoundException(Exception):
     '''Unable to determine the extension'''
 
 
+# Not sure if there is a standard for exit codes?
+EXIT_CODES = {
+    DownloadException: 100,
+    MissingFileinfoException: 101,
+    MissingUrlException: 102,
+}
+
+
 class Package:
     '''Hold information about a source package'''
 
@@ -55,6 +65,7 @@ class Package:
     _new_bugs = None
     _date = None
     _additional_files = None
+    _checksums = None
     _debian_tar_path = None
 
     def __init__(
@@ -63,18 +74,14 @@ class Package:
         self.name = name
         self.version = version
         self.simple_version = version.split(':', 1)[1] if ':' in version else version
-        self.bugs = bugs
+        # bugs can be a list or a callable returning the list so the BTS is
+        # only queried when the bug report is needed
+        self._bugs = bugs
         self.force = force
         self.working_dir = working_dir
         self.fullname = '{}_{}'.format(self.name, self.simple_version)
         self.basename = self.fullname.split('-')[0]
         self.logger = logging.getLogger('debcompare.Package')
-        self.session = Session()
-        retries = Retry(
-            total=5, backoff_factor=0.1, status_forcelist=[500, 502, 503, 504]
-        )
-        self.session.mount("http://", HTTPAdapter(max_retries=retries))
-        self.session.mount("https://", HTTPAdapter(max_retries=retries))
 
         self.fileinfo_path = os.path.join(
             self.working_dir, '{}.info'.format(self.fullname)
@@ -90,11 +97,15 @@ class Package:
             if os.path.isfile(self.dsc_path):
                 os.remove(self.dsc_path)
 
-        self.dsc_url = self._get_url('{}.dsc'.format(self.fullname))
         self._fileinfo = unpickle_file(self.fileinfo_path, self.force)
+        incr('cache_misses' if self._fileinfo is None else 'cache_hits',
+             cache='fileinfo')
 
         if not os.path.isfile(self.dsc_path):
+            incr('cache_misses', cache='download')
             self._download_file(self.dsc_url, self.dsc_path)
+        else:
+            incr('cache_hits', cache='download')
 
         if self.force:
             for additional_file in self.additional_files:
@@ -105,17 +116,40 @@ class Package:
         for additional_file in self.additional_files:
             path = os.path.join(self.working_dir, additional_file)
             if not os.path.isfile(path):
+                incr('cache_misses', cache='download')
                 url = self._get_url(additional_file)
                 self._download_file(url, path)
+            else:
+                incr('cache_hits', cache='download')
+
+    @property
+    def dsc_url(self):
+        '''the snapshot download url of the dsc file'''
+        return self._get_url('{}.dsc'.format(self.fullname))
+
+    @property
+    def bugs(self):
+        '''list of all bugs for this package'''
+        if callable(self._bugs):
+            self._bugs = self._bugs()
+        return self._bugs
 
     def _download_file(self, source, destination):
         '''download a file from source and save it in destination'''
         self.logger.info('Downloading: %s', source)
-        response = self.session.get(source, timeout=10)
+        start = time.perf_counter()
+        with span('download'):
+            response = transport.get(source)
         if response.status_code != 200:
             self.logger.error('unable to download %s from %s', destination, source)
             raise DownloadException
-        self.logger.info('Saving: %s', destination)
+        incr('bytes_downloaded', len(response.content))
+        self.logger.info(
+            'Saving: %s (%d bytes in %.3fs)',
+            destination,
+            len(response.content),
+            time.perf_counter() - start,
+        )
         write_file(response.content, destination)
 
     def _get_url(self, name):
@@ -148,6 +182,25 @@ class Package:
                             self._additional_files.append(words[2])
         return self._additional_files
 
+    @property
+    def checksums(self):
+        '''the sha256 checksums of the package files listed in the dsc'''
+        if self._checksums is None:
+            self._checksums = {}
+            with open(self.dsc_path, 'r') as dsc_file:
+                checksums_section = False
+                for line in dsc_file.readlines():
+                    if line.strip('\n') == 'Checksums-Sha256:':
+                        checksums_section = True
+                        continue
+                    if checksums_section:
+                        if not line or line[0] != ' ':
+                            break
+                        words = line.split()
+                        if len(words) == 3:
+                            self._checksums[words[2]] = words[0]
+        return self._checksums
+
     @property
     def new_bugs(self):
         '''list of bugs that have been raised since this package was created'''
@@ -166,7 +219,8 @@ class Package:
                 url=SNAPSHOT_URL, name=self.name, version=self.version
             )
             self.logger.info('Fetching: %s', url)
-            response = self.session.get(url, timeout=10)
+            with span('fileinfo_fetch'):
+                response = transport.get(url)
             if response.status_code != 200:
                 msg = 'unable to get snapshot fileinfo for {}'.format(self.fullname)
                 self.logger.error(msg)
@@ -182,6 +236,8 @@ class Package:
         attempt to parse a diff file for the changelog
         its not pretty but i think it mostly works
         """
+        from debian.changelog import Changelog
+
         _open = None
         for additional_file in self.additional_files:
             path = os.path.join(self.working_dir, additional_file)
@@ -204,7 +260,8 @@ class Package:
                         continue
                     if line.startswith('---') and changelog:
                         changelog = False
-                        return Changelog(content)
+                        with span('changelog_parse'):
+                            return Changelog(content)
                     if changelog:
                         if line[0] == '@':
                             continue
@@ -229,14 +286,17 @@ class Package:
     @property
     def changelog(self):
         '''parse the changelog of the package and return a Changelog object'''
-        if not self.debian_tar_path:
+        if self._changelog is None and not self.debian_tar_path:
             self._changelog = self._changelog_from_diff
         if self._changelog is None:
+            from debian.changelog import Changelog
+
             tar = tarfile.open(self.debian_tar_path, 'r')
             for member in tar.getmembers():
                 if member.name == 'debian/changelog':
                     changelog = tar.extractfile(member)
-                    self._changelog = Changelog(changelog.read())
+                    with span('changelog_parse'):
+                        self._changelog = Changelog(changelog.read())
                     break
         return self._changelog
 
@@ -264,6 +324,7 @@ class Differ:
     _bugs = None
     _security_bugs = None
     _diff = None
+    _summary = None
 
     def __init__(
         self,
@@ -299,23 +360,29 @@ class Differ:
         self._diff = read_file(self.diff_path)
         self._bugs = unpickle_file(self.bugs_path, self.force)
         self._security_bugs = unpickle_file(self.security_bugs_path, self.force)
+        incr('cache_misses' if self._diff is None else 'cache_hits', cache='diff')
+        incr('cache_misses' if self._bugs is None else 'cache_hits', cache='bugs')
 
         if os.path.isfile(self.diff_path):
             self._diff = read_file(self.diff_path)
 
         self.base_package = Package(
-            self.name, self.old_version, self.bugs, self.force, self.working_dir
+            self.name, self.old_version, lambda: self.bugs, self.force, self.working_dir
         )
         self.new_package = Package(
-            self.name, self.new_version, self.bugs, self.force, self.working_dir
+            self.name, self.new_version, lambda: self.bugs, self.force, self.working_dir
         )
 
     @property
     def bugs(self):
         '''get a list of all open bugs for this package'''
         if self._bugs is None:
+            import debianbts as bts
+
             # should we do archive=both here?
-            self._bugs = bts.get_status(bts.get_bugs(package=self.name))
+            transport.throttle(BTS_HOST)
+            with span('bts_get_status'):
+                self._bugs = bts.get_status(bts.get_bugs(package=self.name))
             pickle_tofile(self._bugs, self.bugs_path)
         return self._bugs
 
@@ -323,9 +390,13 @@ class Differ:
     def security_bugs(self):
         '''get a list of all open bugs for this package'''
         if self._security_bugs is None:
-            self._security_bugs = bts.get_status(
-                bts.get_bugs(package=self.name, tag='security', archive='both')
-            )
+            import debianbts as bts
+
+            transport.throttle(BTS_HOST)
+            with span('bts_get_status'):
+                self._security_bugs = bts.get_status(
+                    bts.get_bugs(package=self.name, tag='security', archive='both')
+                )
             pickle_tofile(self._security_bugs, self.security_bugs_path)
         return self._security_bugs
 
@@ -336,13 +407,15 @@ class Differ:
             cmd = [self.debdiff, self.base_package.dsc_path, self.new_package.dsc_path]
             try:
                 # debdiff exits 0 if there are no changes
-                check_output(cmd, env=dict(os.environ, TMPDIR=self.working_dir))
+                with span('debdiff'):
+                    check_output(cmd, env=dict(os.environ, TMPDIR=self.working_dir))
                 self.logger.warning('No difference found')
             except CalledProcessError as error:
                 # debdiff exits 1 if there are changes
                 if error.returncode == 1:
                     self.logger.info(error.output)
                     self._diff = error.output
+                    incr('bytes_diffed', len(self._diff))
                     write_file(self._diff, self.diff_path)
                 else:
                     self.logger.error(
@@ -350,10 +423,81 @@ class Differ:
                     )
         return self._diff
 
-    def cli_report(self, color=True, phab=False):
-        '''print a nice report for cli interface'''
+    @property
+    def summary(self):
+        '''
+        (unchanged, changes) from the dsc checksums and tar member headers,
+        see debcompare.summary.summarize
+        '''
+        if self._summary is None:
+            from debcompare.summary import summarize
+
+            self._summary = summarize(self.base_package, self.new_package)
+        return self._summary
+
+    def cli_summary(self, color=True, output=None):
+        '''print the summary report to output, default stdout'''
+        _print = partial(print, file=output)
+
+        if color:
+            from fabulous.color import red, green, bold
+        _red = red if color else lambda string: string
+        _green = green if color else lambda string: string
+        _bold = bold if color else lambda string: string
+
+        unchanged, changes = self.summary
+        _print(
+            _bold(
+                ''.join(
+                    [
+                        '=' * 10,
+                        ' Summary Report {}: {} -> {} '.format(
+                            self.name, self.old_version, self.new_version
+                        ),
+                        '=' * 10,
+                    ]
+                )
+            )
+        )
+        for filename in unchanged:
+            _print(' = {} (unchanged)'.format(filename))
+        for change in changes:
+            if change.status == 'A':
+                size = '{} bytes'.format(change.new_size)
+            elif change.status == 'D':
+                size = '{} bytes'.format(change.old_size)
+            elif change.old_size is None or change.new_size is None:
+                # an orig file patched by a diff.gz
+                size = 'patched'
+            else:
+                size = '{:+d} bytes'.format(change.new_size - change.old_size)
+            lines = ''
+            if change.added is not None:
+                lines = ', +{} -{} lines'.format(change.added, change.removed)
+            line = ' {} {} ({}{})'.format(change.status, change.path, size, lines)
+            if change.status == 'A':
+                _print(_green(line))
+            elif change.status == 'D':
+                _print(_red(line))
+            else:
+                _print(line)
+        _print(
+            _bold(
+                '{} added, {} removed, {} modified'.format(
+                    *[
+                        len([c for c in changes if c.status == status])
+                        for status in 'ADM'
+                    ]
+                )
+            )
+        )
+
+    def cli_report(self, color=True, phab=False, diff_only=False, output=None):
+        '''print a nice report for cli interface to output, default stdout'''
         # pylint: disable=too-many-branches
 
+        _print = partial(print, file=output)
+
         if color:
             from fabulous.color import red, green, bold
         _red = red if color else lambda string: string
@@ -363,7 +507,7 @@ class Differ:
         diff_hack = False
         # i use the join here so i can use the lambda trick above
         #  im sure there is a better way to do this so please send code
-        print(
+        _print(
             _bold(
                 ''.join(
                     [
@@ -377,7 +521,7 @@ class Differ:
             )
         )
         if phab:
-            print('```')
+            _print('```')
         for line in self.diff.decode().split('\n'):
             if not line:
                 continue
@@ -394,45 +538,47 @@ class Differ:
             if not line:
                 continue
             if line[0] == '+':
-                print(_green(line))
+                _print(_green(line))
             elif line[0] == '-':
-                print(_red(line))
+                _print(_red(line))
             else:
-                print(line)
+                _print(line)
         if phab:
-            print('```')
+            _print('```')
+        if diff_only:
+            return
 
-        print(_bold(''.join(['=' * 12, ' Bug Report ', '=' * 12])))
+        _print(_bold(''.join(['=' * 12, ' Bug Report ', '=' * 12])))
         if not self.new_package.new_bugs:
-            print(_bold('No bug reports, YAY :D'))
+            _print(_bold('No bug reports, YAY :D'))
         else:
             for bug in sorted(self.new_package.new_bugs, key=lambda x: x.bug_num):
                 if phab:
-                    print(
+                    _print(
                         '* {0}: [[[https://bugs.debian.org/cgi-bin/bugreport.cgi?bug={1}'
                         ' | {1}]]] {2}'.format(bug.date, bug.bug_num, bug.subject)
                     )
                 else:
-                    print(
+                    _print(
                         ' * {}: [{}] {}'.format(
                             _bold(bug.date), _bold(bug.bug_num), bug.subject
                         )
                     )
 
-        print(_bold(''.join(['=' * 12, ' CVE Report ', '=' * 12])))
+        _print(_bold(''.join(['=' * 12, ' CVE Report ', '=' * 12])))
         if not self.fixed_cves:
-            print(_bold('No CVE\'s fixed in this update'))
+            _print(_bold('No CVE\'s fixed in this update'))
         else:
             for cve in self.fixed_cves:
                 if phab:
-                    print(
+                    _print(
                         '* [[https://security-tracker.debian.org/tracker/{0} | {0}]]: '
                         ' [{1}] {2}'.format(cve.cve, cve.scope, cve.description)
                     )
                     for note in cve.notes:
-                        print('** [[{0} | {0}]]'.format(note))
+                        _print('** [[{0} | {0}]]'.format(note))
                 else:
-                    print(
+                    _print(
                         ' * {}: [{}] {}{}'.format(
                             _bold(cve.cve),
                             cve.scope,
@@ -473,8 +619,8 @@ def pickle_tofile(obj, destination):
         pickle.dump(obj, destination_file)
 
 
-def get_args():
-    '''return argparse object'''
+def get_parser():
+    '''return the argument parser shared by the cli and the daemon client'''
     parser = ArgumentParser(description=__doc__)
     parser.add_argument(
         '-o',
@@ -492,6 +638,19 @@ def get_args():
     parser.add_argument(
         '--no-color', action='store_true', help='force a re-download of all files'
     )
+    parser.add_argument(
+        '-d',
+        '--diff-only',
+        action='store_true',
+        help='only report the diff, skipping the BTS and security tracker',
+    )
+    parser.add_argument(
+        '-S',
+        '--summary',
+        action='store_true',
+        help='only summarise the changed files from the dsc and tarball metadata '
+        'without running debdiff, skipping the BTS and security tracker',
+    )
     parser.add_argument(
         '-p', '--phab', action='store_true', help='format for a phab post'
     )
@@ -501,11 +660,30 @@ def get_args():
         default='/var/tmp/debcompare',
         help='A directory to store downloaded files',
     )
+    parser.add_argument(
+        '--timings',
+        action='store_true',
+        help='print per stage timings and counters to stderr',
+    )
+    parser.add_argument(
+        '--profile', metavar='FILE', help='write a profile of the run to FILE'
+    )
+    parser.add_argument(
+        '--profiler',
+        choices=PROFILERS,
+        default='cprofile',
+        help='the profiler to use with --profile',
+    )
     parser.add_argument(
         '-v', '--verbose', action='count', help='Add more to increase verbosity'
     )
     parser.add_argument('package', help='The package to compare')
-    return parser.parse_args()
+    return parser
+
+
+def get_args(argv=None):
+    '''return argparse object'''
+    return get_parser().parse_args(argv)
 
 
 def set_log_level(args_level):
@@ -521,64 +699,73 @@ def set_log_level(args_level):
     logging.basicConfig(level=log_level)
 
 
-def main():
-    '''the main function'''
-    # pylint: disable=too-many-locals
-    # pylint: disable=too-many-branches
-    # pylint: disable=too-many-statements
+def previous_version(version):
+    '''
+    return the security update preceding version e.g. 1.0-1+deb9u2 -> 1.0-1+deb9u1
+    and 1.0-1+deb9u1 -> 1.0-1, or None if version doesn't look like an update
+    '''
+    match = search(r'(.*?)([+-~])deb(\d+)u(\d+)$', version)
+    if match is None:
+        return None
+    base_version, modifier, deb_version, deb_update = match.groups()
+    if int(deb_update) == 1:
+        return base_version
+    return '{}{}deb{}u{}'.format(base_version, modifier, deb_version, int(deb_update) - 1)
+
+
+def next_version(version):
+    '''
+    return the security update following version e.g. 1.0-1+deb9u1 -> 1.0-1+deb9u2
+    or None if version doesn't look like an update
+    '''
+    match = search(r'(.*?)([+-~])deb(\d+)u(\d+)$', version)
+    if match is None:
+        return None
+    base_version, modifier, deb_version, deb_update = match.groups()
+    return '{}{}deb{}u{}'.format(base_version, modifier, deb_version, int(deb_update) + 1)
 
-    args = get_args()
-    set_log_level(args.verbose)
-    logger = logging.getLogger('debcompare.Main')
-    new_version = args.new_version
-    old_version = args.old_version
-    cve_data_file = os.path.join(args.working_dir, 'cve.json')
-
-    if os.path.isfile(cve_data_file):
-        if args.force:
-            os.remove(cve_data_file)
-    if not os.path.isfile(cve_data_file):
-        with open(cve_data_file, 'w') as cve_fh:
-            data = get(SECURITY_TRACKERDATA_URL, timeout=10).json()
-            json.dump(data, cve_fh)
 
+def resolve_versions(old_version, new_version):
+    '''fill in whichever of old_version and new_version is missing'''
+    logger = logging.getLogger('debcompare.Main')
     if old_version is None and new_version is None:
         logger.error('You must specify old-version and/or new-version')
-        SystemExit(1)
-    elif old_version is None:
-        match = search(r'(.*?)([+-~])deb(\d+)u(\d+)$', new_version)
-        if match is None:
+        raise SystemExit(1)
+    if old_version is None:
+        old_version = previous_version(new_version)
+        if old_version is None:
             logger.error(
                 'unable to determine the next version as new version looks invalid'
             )
             raise SystemExit(1)
-        base_version = match.group(1)
-        modifier = match.group(2)
-        deb_version = match.group(3)
-        deb_update = int(match.group(4))
-        if deb_update == 1:
-            old_version = base_version
-        else:
-            old_deb_version = 'deb{}u{}'.format(deb_version, deb_update - 1)
-            old_version = '{}{}{}'.format(base_version, modifier, old_deb_version)
         logger.debug('old_version determined: %s', old_version)
     elif new_version is None:
-        match = search(r'(.*?)([+-~])deb(\d+)u(\d+)$', old_version)
-        if match is None:
+        new_version = next_version(old_version)
+        if new_version is None:
             logger.error(
                 'unable to determine the next version as base version look invalid'
             )
             raise SystemExit(1)
-        base_version = match.group(1)
-        modifier = match.group(2)
-        deb_version = match.group(3)
-        deb_update = int(match.group(4))
-        new_deb_version = 'deb{}u{}'.format(deb_version, deb_update + 1)
-        new_version = '{}{}{}'.format(base_version, modifier, new_deb_version)
         logger.debug('new_version determined: %s', new_version)
+    return old_version, new_version
+
+
+def update_cve_data(working_dir, force=False):
+    '''download the security tracker data if needed and return its path'''
+    cve_data_file = os.path.join(working_dir, 'cve.json')
+    update_data_file(cve_data_file, force)
+    return cve_data_file
 
-    packages_cve = PackagesCVE(cve_data_file)
-    fixed_cves = packages_cve.get_cves(args.package, new_version)
+
+def run(args, output=None):
+    '''compare the packages described by args and print the report'''
+    transport.configure(cache_dir=os.path.join(args.working_dir, 'http'))
+    old_version, new_version = resolve_versions(args.old_version, args.new_version)
+
+    fixed_cves = None
+    if not (args.diff_only or args.summary):
+        packages_cve = PackagesCVE(update_cve_data(args.working_dir, args.force))
+        fixed_cves = packages_cve.get_cves(args.package, new_version)
 
     try:
         differ = Differ(
@@ -589,15 +776,29 @@ def main():
             args.force,
             args.working_dir,
         )
-    except DownloadException:
-        # Not sure if there is a standard for exit codes?
-        raise SystemExit(100)
-    except MissingFileinfoException:
-        raise SystemExit(101)
-    except MissingUrlException:
-        raise SystemExit(102)
-
-    differ.cli_report(not args.no_color, args.phab)
+    except tuple(EXIT_CODES) as error:
+        raise SystemExit(EXIT_CODES[type(error)])
+
+    if args.summary:
+        differ.cli_summary(not args.no_color, output)
+    else:
+        differ.cli_report(not args.no_color, args.phab, args.diff_only, output)
+
+
+def main(args=None):
+    '''the main function, args are parsed from the command line if not given'''
+    if args is None:
+        args = get_args()
+    set_log_level(args.verbose)
+    try:
+        if args.profile:
+            with profile(args.profile, args.profiler):
+                run(args)
+        else:
+            run(args)
+    finally:
+        if args.timings:
+            print(METRICS.report(), file=sys.stderr)
 
 
 if __name__ == "__main__":
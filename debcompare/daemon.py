@@ -0,0 +1,257 @@
+#!/usr/bin/env python3
+'''
+debcompared: serve comparisons over a unix socket keeping the tracker index,
+downloaded packages, BTS data and parsed changelogs warm between requests
+'''
+import io
+import json
+import logging
+import os
+import socketserver
+import threading
+import time
+from argparse import ArgumentParser, Namespace
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from debcompare import transport
+from debcompare.compare import (
+    EXIT_CODES, Differ, resolve_versions, set_log_level, update_cve_data,
+)
+from debcompare.metrics import collect
+from debcompare.prefetch import Prefetcher, new_fixed_versions, parse_size
+from debcompare.secinfo import PackagesCVE, update_data_file
+
+
+SOCKET_PATH = '/var/tmp/debcompare/debcompared.sock'
+
+
+class State:
+    '''the warm state shared by all requests'''
+
+    def __init__(self, max_differs=64):
+        self.max_differs = max_differs
+        self.logger = logging.getLogger('debcompare.State')
+        self._lock = threading.Lock()
+        self._tracker_lock = threading.Lock()
+        self._packages_cve = {}
+        self._differs = OrderedDict()
+        self._differ_locks = {}
+
+    def packages_cve(self, working_dir, force=False):
+        '''return the tracker index for working_dir, reloading it if it changed'''
+        with self._tracker_lock:
+            return self._load_packages_cve(update_cve_data(working_dir, force))
+
+    def refresh(self, working_dir):
+        '''
+        download the tracker data, return the reloaded index or None if it
+        didn't change.  Done under the same lock as the -f requests so only
+        one thread replaces the data file at a time
+        '''
+        cve_data_file = os.path.join(working_dir, 'cve.json')
+        with self._tracker_lock:
+            if not update_data_file(cve_data_file, True):
+                return None
+            return self._load_packages_cve(cve_data_file)
+
+    def _load_packages_cve(self, cve_data_file):
+        '''return the cached index for cve_data_file, call with _tracker_lock held'''
+        working_dir = os.path.dirname(cve_data_file)
+        mtime = os.stat(cve_data_file).st_mtime_ns
+        cached = self._packages_cve.get(working_dir)
+        if cached is None or cached[0] != mtime:
+            self.logger.info('loading %s', cve_data_file)
+            cached = (mtime, PackagesCVE(cve_data_file))
+            self._packages_cve[working_dir] = cached
+        return cached[1]
+
+    def _differ_lock(self, key):
+        '''return the lock serialising work on a single comparison'''
+        with self._lock:
+            return self._differ_locks.setdefault(key, threading.Lock())
+
+    @contextmanager
+    def differ(self, name, old_version, new_version, fixed_cves, force, working_dir):
+        '''
+        yield a cached Differ with fixed_cves set, holding the lock of its
+        comparison until the block ends so concurrent requests and prefetches
+        for the same comparison don't see each others fixed_cves.
+        Comparisons for different packages don't block each other
+        '''
+        # pylint: disable=too-many-arguments
+        key = (name, old_version, new_version, working_dir)
+        with self._differ_lock(key):
+            with self._lock:
+                differ = None if force else self._differs.get(key)
+                if differ is not None:
+                    self._differs.move_to_end(key)
+            if differ is None:
+                differ = Differ(
+                    name, old_version, new_version, fixed_cves, force, working_dir
+                )
+                with self._lock:
+                    self._differs[key] = differ
+                    while len(self._differs) > self.max_differs:
+                        old_key, _ = self._differs.popitem(last=False)
+                        self._differ_locks.pop(old_key, None)
+            differ.fixed_cves = fixed_cves
+            yield differ
+
+    def compare(self, args):
+        '''
+        run a comparison for the parsed debcompare.compare arguments,
+        return (status, output)
+        '''
+        output = io.StringIO()
+        try:
+            old_version, new_version = resolve_versions(
+                args.old_version, args.new_version)
+            fixed_cves = None
+            if not (args.diff_only or args.summary):
+                fixed_cves = self.packages_cve(args.working_dir, args.force).get_cves(
+                    args.package, new_version)
+            try:
+                with self.differ(
+                    args.package, old_version, new_version, fixed_cves, args.force,
+                    args.working_dir,
+                ) as differ:
+                    if args.summary:
+                        differ.cli_summary(not args.no_color, output)
+                    else:
+                        differ.cli_report(
+                            not args.no_color, args.phab, args.diff_only, output)
+            except tuple(EXIT_CODES) as error:
+                raise SystemExit(EXIT_CODES[type(error)])
+        except SystemExit as error:
+            return error.code or 0, output.getvalue()
+        return 0, output.getvalue()
+
+
+def refresh_loop(state, working_dir, interval, concurrency, disk_budget):
+    '''refresh the tracker data every interval seconds and prefetch new updates'''
+    # pylint: disable=too-many-arguments
+    logger = logging.getLogger('debcompare.Daemon')
+    prefetcher = Prefetcher(
+        None, working_dir, concurrency, disk_budget,
+        lambda name, old, new, fixed_cves: state.differ(
+            name, old, new, fixed_cves, False, working_dir),
+    )
+    while True:
+        time.sleep(interval)
+        try:
+            packages_cve = state.refresh(working_dir)
+            if packages_cve is None:
+                continue
+            prefetcher.packages_cve = packages_cve
+            versions = new_fixed_versions(packages_cve, packages_cve.previous)
+            logger.info('prefetching %d new versions', len(versions))
+            prefetcher.schedule(versions)
+        except Exception:  # pylint: disable=broad-except
+            logger.exception('unable to refresh the tracker data')
+
+
+class RequestHandler(socketserver.StreamRequestHandler):
+    '''read a json request line and answer with a json response line'''
+
+    def handle(self):
+        logger = logging.getLogger('debcompare.Daemon')
+        try:
+            args = Namespace(**json.loads(self.rfile.readline())['args'])
+            # only report what this request did, not the daemon totals
+            with collect() as metrics:
+                status, output = self.server.state.compare(args)
+            response = {'status': status, 'output': output}
+            if args.timings:
+                response['timings'] = metrics.report()
+        except Exception as error:  # pylint: disable=broad-except
+            logger.exception('request failed')
+            response = {'status': 1, 'output': '', 'error': str(error)}
+        self.wfile.write(json.dumps(response).encode() + b'\n')
+
+
+class Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    '''threaded unix socket server so requests don't block each other'''
+
+    daemon_threads = True
+
+    def __init__(self, socket_path, state):
+        self.state = state
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+        super().__init__(socket_path, RequestHandler)
+
+
+def get_args():
+    '''return argparse object'''
+    parser = ArgumentParser(description=__doc__)
+    parser.add_argument(
+        '-s', '--socket', default=SOCKET_PATH, help='the unix socket to listen on'
+    )
+    parser.add_argument(
+        '--max-differs',
+        type=int,
+        default=64,
+        help='number of comparisons to keep in memory',
+    )
+    parser.add_argument(
+        '-w',
+        '--working-dir',
+        default='/var/tmp/debcompare',
+        help='the working directory refreshed with --refresh-interval',
+    )
+    parser.add_argument(
+        '--refresh-interval',
+        type=int,
+        help='refresh the tracker data every this many seconds and prefetch '
+        'comparisons for new security updates',
+    )
+    parser.add_argument(
+        '-j',
+        '--prefetch-concurrency',
+        type=int,
+        default=2,
+        help='number of parallel prefetches',
+    )
+    parser.add_argument(
+        '--disk-budget',
+        type=parse_size,
+        help='stop prefetching once the working directory is this big e.g. 20G',
+    )
+    parser.add_argument(
+        '-v', '--verbose', action='count', help='Add more to increase verbosity'
+    )
+    return parser.parse_args()
+
+
+def main():
+    '''the main function'''
+    args = get_args()
+    set_log_level(args.verbose)
+    socket_dir = os.path.dirname(args.socket)
+    if socket_dir and not os.path.exists(socket_dir):
+        os.makedirs(socket_dir)
+    state = State(args.max_differs)
+    server = Server(args.socket, state)
+    # the http cache is shared by all requests whatever their working dir,
+    # the transport is global so it can't change per request
+    transport.configure(cache_dir=os.path.join(args.working_dir, 'http'))
+    if args.refresh_interval:
+        threading.Thread(
+            target=refresh_loop,
+            args=(state, args.working_dir, args.refresh_interval,
+                  args.prefetch_concurrency, args.disk_budget),
+            daemon=True,
+        ).start()
+    logging.getLogger('debcompare.Daemon').info('listening on %s', args.socket)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        os.remove(args.socket)
+
+
+if __name__ == "__main__":
+    main()
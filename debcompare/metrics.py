@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+'''lightweight timing spans, counters and profiling hooks'''
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+
+PROFILERS = ['cprofile', 'pyinstrument']
+
+
+class Metrics:
+    '''thread safe store of span durations and counters'''
+
+    def __init__(self, prefix='debcompare'):
+        self.prefix = prefix
+        self.logger = logging.getLogger('debcompare.Metrics')
+        self._lock = threading.Lock()
+        self.spans = {}
+        self.counters = {}
+
+    @staticmethod
+    def _key(name, labels):
+        '''return a hashable key for name and labels'''
+        return (name, tuple(sorted(labels.items())))
+
+    def observe(self, name, duration, **labels):
+        '''record a span of duration seconds under name'''
+        key = self._key(name, labels)
+        with self._lock:
+            count, total, longest = self.spans.get(key, (0, 0.0, 0.0))
+            self.spans[key] = (count + 1, total + duration, max(longest, duration))
+
+    def incr(self, name, value=1, **labels):
+        '''increment the counter name by value'''
+        key = self._key(name, labels)
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    @staticmethod
+    def _labels(labels, **extra):
+        '''format labels in the prometheus exposition format'''
+        labels = list(labels) + sorted(extra.items())
+        if not labels:
+            return ''
+        return '{{{}}}'.format(
+            ','.join('{}="{}"'.format(key, str(value).replace('"', '\\"'))
+                     for key, value in labels)
+        )
+
+    def report(self):
+        '''return a human readable report'''
+        with self._lock:
+            spans = sorted(self.spans.items())
+            counters = sorted(self.counters.items())
+        lines = ['{:<40} {:>6} {:>10} {:>10}'.format('span', 'count', 'total', 'max')]
+        for (name, labels), (count, total, longest) in spans:
+            lines.append('{:<40} {:>6} {:>9.3f}s {:>9.3f}s'.format(
+                name + self._labels(labels), count, total, longest))
+        lines.append('{:<40} {:>6}'.format('counter', 'value'))
+        for (name, labels), value in counters:
+            lines.append('{:<40} {:>6}'.format(name + self._labels(labels), value))
+        return '\n'.join(lines)
+
+    def prometheus(self):
+        '''return the metrics in the prometheus text exposition format'''
+        with self._lock:
+            spans = sorted(self.spans.items())
+            counters = sorted(self.counters.items())
+        lines = []
+        if spans:
+            name = '{}_span_seconds'.format(self.prefix)
+            lines.append('# HELP {} time spent in each stage'.format(name))
+            lines.append('# TYPE {} summary'.format(name))
+            for (span_name, labels), (count, total, _) in spans:
+                lines.append('{}_sum{} {}'.format(
+                    name, self._labels(labels, span=span_name), total))
+                lines.append('{}_count{} {}'.format(
+                    name, self._labels(labels, span=span_name), count))
+        for counter in sorted({name for (name, _), _ in counters}):
+            name = '{}_{}_total'.format(self.prefix, counter)
+            lines.append('# TYPE {} counter'.format(name))
+            for (other, labels), value in counters:
+                if other == counter:
+                    lines.append('{}{} {}'.format(name, self._labels(labels), value))
+        return '\n'.join(lines) + '\n'
+
+
+METRICS = Metrics()
+# the Metrics of the request being served in this thread, see collect
+_COLLECTING = ContextVar('debcompare_collecting', default=None)
+
+
+@contextmanager
+def span(name, **labels):
+    '''time the enclosed block in METRICS and the collecting Metrics'''
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        duration = time.perf_counter() - start
+        METRICS.observe(name, duration, **labels)
+        collecting = _COLLECTING.get()
+        if collecting is not None:
+            collecting.observe(name, duration, **labels)
+        METRICS.logger.debug('%s %s took %.3fs', name, labels or '', duration)
+
+
+def incr(name, value=1, **labels):
+    '''increment the counter name in METRICS and the collecting Metrics'''
+    METRICS.incr(name, value, **labels)
+    collecting = _COLLECTING.get()
+    if collecting is not None:
+        collecting.incr(name, value, **labels)
+
+
+@contextmanager
+def collect():
+    '''
+    yield a Metrics recording only the spans and counters of the enclosed
+    block in the current thread, METRICS keeps the process wide totals
+    '''
+    metrics = Metrics()
+    token = _COLLECTING.set(metrics)
+    try:
+        yield metrics
+    finally:
+        _COLLECTING.reset(token)
+
+
+@contextmanager
+def profile(destination, profiler='cprofile'):
+    '''
+    profile the enclosed block and dump the results to destination.
+    cprofile writes a pstats file, pyinstrument writes an html report
+    '''
+    if profiler == 'pyinstrument':
+        from pyinstrument import Profiler
+        pyinstrument_profiler = Profiler()
+        pyinstrument_profiler.start()
+        try:
+            yield
+        finally:
+            pyinstrument_profiler.stop()
+            with open(destination, 'w') as output:
+                output.write(pyinstrument_profiler.output_html())
+    elif profiler == 'cprofile':
+        from cProfile import Profile
+        cprofile_profiler = Profile()
+        cprofile_profiler.enable()
+        try:
+            yield
+        finally:
+            cprofile_profiler.disable()
+            cprofile_profiler.dump_stats(destination)
+    else:
+        raise ValueError('unknown profiler: {}'.format(profiler))
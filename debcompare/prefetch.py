@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+'''
+warm the caches for newly released security updates so the first reviewer
+to open a comparison doesn't wait for the downloads, BTS, debdiff and notes
+'''
+import io
+import logging
+import os
+from argparse import ArgumentParser
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+
+from debcompare import compare, transport
+from debcompare.compare import Differ, previous_version, set_log_level
+from debcompare.metrics import incr, span
+from debcompare.secinfo import PackagesCVE, update_data_file
+
+
+SIZE_SUFFIXES = {'K': 2 ** 10, 'M': 2 ** 20, 'G': 2 ** 30, 'T': 2 ** 40}
+
+
+def parse_size(size):
+    '''parse a size like 512M or 20G into bytes'''
+    size = str(size).strip().upper()
+    if size and size[-1] in SIZE_SUFFIXES:
+        return int(float(size[:-1]) * SIZE_SUFFIXES[size[-1]])
+    return int(size)
+
+
+def disk_usage(path):
+    '''return the number of bytes used by the files under path'''
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                continue
+    return total
+
+
+def new_fixed_versions(packages_cve, previous):
+    '''
+    return the sorted (package, fixed_version) pairs resolved in packages_cve
+    that were not resolved with that version in previous
+    '''
+    if previous is None:
+        return []
+    fixed = set()
+    for _, package, _, _, new in packages_cve.changes(previous):
+        if new is None or new[0] != 'resolved' or not new[1]:
+            continue
+        fixed.add((package, new[1]))
+    return sorted(fixed)
+
+
+def snapshot_previous_version(package, version):
+    '''return the newest version of package on snapshot older than version'''
+    from debian.debian_support import Version
+
+    url = '{}/mr/package/{}/'.format(compare.SNAPSHOT_URL, package)
+    response = transport.get(url)
+    if response.status_code != 200:
+        return None
+    target = Version(version)
+    older = [
+        Version(result['version'])
+        for result in response.json().get('result', [])
+        if Version(result['version']) < target
+    ]
+    return str(max(older)) if older else None
+
+
+def find_previous_version(package, version):
+    '''the version to compare a new security update against'''
+    return previous_version(version) or snapshot_previous_version(package, version)
+
+
+class Prefetcher:
+    '''warm comparisons in the background within a concurrency and disk budget'''
+
+    # pylint: disable=too-many-arguments
+
+    def __init__(
+        self, packages_cve, working_dir, concurrency=2, disk_budget=None, get_differ=None
+    ):
+        self.packages_cve = packages_cve
+        self.working_dir = working_dir
+        self.disk_budget = disk_budget
+        # get_differ returns a context manager yielding the Differ, the daemon
+        # passes its own factory so prefetched Differs stay in memory and
+        # aren't rendered by a request at the same time
+        self.get_differ = get_differ or (
+            lambda name, old, new, fixed_cves: nullcontext(
+                Differ(name, old, new, fixed_cves, working_dir=self.working_dir)
+            )
+        )
+        self.logger = logging.getLogger('debcompare.Prefetcher')
+        self.executor = ThreadPoolExecutor(
+            max_workers=concurrency, thread_name_prefix='prefetch'
+        )
+
+    def over_budget(self):
+        '''True if the working directory uses more than the disk budget'''
+        return (
+            self.disk_budget is not None
+            and disk_usage(self.working_dir) >= self.disk_budget
+        )
+
+    def warm(self, package, version):
+        '''warm every cache used by the comparison of version with its predecessor'''
+        if self.over_budget():
+            self.logger.warning('disk budget reached, skipping %s %s', package, version)
+            incr('prefetch', result='skipped')
+            return False
+        try:
+            old_version = find_previous_version(package, version)
+            if old_version is None:
+                self.logger.warning('unable to find the version before %s %s',
+                                    package, version)
+                incr('prefetch', result='skipped')
+                return False
+            with span('prefetch'):
+                with self.get_differ(
+                    package, old_version, version,
+                    self.packages_cve.get_cves(package, version),
+                ) as differ:
+                    _ = differ.security_bugs
+                    # rendering the report fetches the diff, bugs and CVE notes
+                    differ.cli_report(color=False, output=io.StringIO())
+        except Exception:  # pylint: disable=broad-except
+            self.logger.exception('unable to prefetch %s %s', package, version)
+            incr('prefetch', result='failed')
+            return False
+        self.logger.info('prefetched %s %s -> %s', package, old_version, version)
+        incr('prefetch', result='warmed')
+        return True
+
+    def schedule(self, versions):
+        '''warm the (package, version) pairs in the background, returns the futures'''
+        return [
+            self.executor.submit(self.warm, package, version)
+            for package, version in versions
+        ]
+
+    def shutdown(self, wait=True):
+        '''stop the workers'''
+        self.executor.shutdown(wait=wait)
+
+
+def get_args():
+    '''return argparse object'''
+    parser = ArgumentParser(description=__doc__)
+    parser.add_argument(
+        '-w',
+        '--working-dir',
+        default='/var/tmp/debcompare',
+        help='A directory to store downloaded files',
+    )
+    parser.add_argument(
+        '-r',
+        '--refresh',
+        action='store_true',
+        help='refresh the tracker data first and prefetch only if it changed',
+    )
+    parser.add_argument(
+        '--since',
+        help='the tracker data to compare against, '
+        'the default is the copy kept by the last update',
+    )
+    parser.add_argument(
+        '-j', '--concurrency', type=int, default=2, help='number of parallel prefetches'
+    )
+    parser.add_argument(
+        '--disk-budget',
+        type=parse_size,
+        help='stop prefetching once the working directory is this big e.g. 20G',
+    )
+    parser.add_argument(
+        '-v', '--verbose', action='count', help='Add more to increase verbosity'
+    )
+    return parser.parse_args()
+
+
+def main():
+    '''the main function'''
+    args = get_args()
+    set_log_level(args.verbose)
+    logger = logging.getLogger('debcompare.Main')
+    if not os.path.exists(args.working_dir):
+        os.makedirs(args.working_dir)
+    transport.configure(cache_dir=os.path.join(args.working_dir, 'http'))
+    cve_data_file = os.path.join(args.working_dir, 'cve.json')
+    refreshed = update_data_file(cve_data_file, args.refresh)
+    if args.refresh and not refreshed:
+        logger.info('tracker data unchanged, nothing to prefetch')
+        return
+    packages_cve = PackagesCVE(cve_data_file)
+    previous = PackagesCVE(args.since) if args.since else packages_cve.previous
+    versions = new_fixed_versions(packages_cve, previous)
+    logger.info('prefetching %d new versions', len(versions))
+    prefetcher = Prefetcher(
+        packages_cve, args.working_dir, args.concurrency, args.disk_budget
+    )
+    prefetcher.schedule(versions)
+    prefetcher.shutdown()
+
+
+if __name__ == "__main__":
+    main()
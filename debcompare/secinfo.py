@@ -3,15 +3,20 @@
 import json
 import logging
 import os
+import pickle
+import shutil
+import sys
 
-from argparse import ArgumentParser
+from argparse import SUPPRESS, ArgumentParser
 from collections import defaultdict
 
-from requests import get
-from debcompare.trackerscrape import Scrape
+from debcompare import transport
+from debcompare.metrics import incr, span
 
 
 SECURITY_TRACKERDATA_URL = 'https://security-tracker.debian.org/tracker/data/json'
+# bump this when the layout of the pickled index changes
+INDEX_VERSION = 4
 
 
 class PackagesCVE():
@@ -22,40 +27,351 @@ class PackagesCVE():
     def __init__(self, data_file):
         self.packages = {}
         self.data_file = data_file
+        self._cve_table = {}
+        self._cves = {}
+        self._resolved = {}
+        self._reverse = None
+        self._previous = None
+        self._changes = None
+        self.key = None
         self.load_data()
 
-    def load_data(self):
-        """Load json data"""
+    @property
+    def index_path(self):
+        """Path of the pickled index built from data_file"""
+        return index_path(self.data_file)
+
+    @property
+    def reverse_index_path(self):
+        """Path of the pickled reverse indexes built from data_file"""
+        return reverse_index_path(self.data_file)
+
+    @property
+    def changes_path(self):
+        """Path of the pickled change list computed by changes"""
+        return '{}.changes'.format(self.data_file)
+
+    @property
+    def stale(self):
+        """True if data_file was replaced since it was loaded"""
+        try:
+            return self._index_key() != self.key
+        except OSError:
+            return False
+
+    def _index_key(self):
+        """Return a key identifying the current content of data_file"""
+        stat = os.stat(self.data_file)
+        return (INDEX_VERSION, stat.st_mtime_ns, stat.st_size)
+
+    @staticmethod
+    def _load_pickle(path, key):
+        """Return the content of a pickled index if it was saved with key"""
+        try:
+            with open(path, 'rb') as file_stream:
+                saved_key, value = pickle.load(file_stream)
+        except (OSError, EOFError, ValueError, pickle.UnpicklingError):
+            return None
+        if saved_key != key:
+            return None
+        return value
+
+    @staticmethod
+    def _save_pickle(path, value, key):
+        """Pickle an index saved with key to path"""
+        tmp_path = '{}.{}'.format(path, os.getpid())
+        try:
+            with open(tmp_path, 'wb') as file_stream:
+                pickle.dump((key, value), file_stream, pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, path)
+        except OSError as error:
+            logging.getLogger('debcompare.PackagesCVE').warning(
+                'unable to save index %s: %s', path, error)
+
+    def load_data(self, rebuild=False):
+        """
+        Load json data, rebuilding the pickled indexes if rebuild is set.
+        The index is pickled next to data_file with the CVE table and each
+        package pickled separately and only unpickled by get_cves, so a lookup
+        doesn't pay for loading the whole tracker.  The reverse indexes are
+        pickled to their own file and only loaded by the queries using them,
+        a rebuild returns them so reverse_index doesn't need to read them back
+        """
         packages = {}
+        cve_table = {}
+        reverse = None
         data = None
+        key = self._index_key()
 
-        with open(self.data_file, 'r') as file_stream:
-            data = json.load(file_stream)
-
-        for package, cves in data.items():
-            packages[package] = defaultdict(list)
-            for cve, meta in cves.items():
-                for data in meta['releases'].values():
-                    if data['status'] == 'resolved':
-                        packages[package][data['fixed_version']].append(
-                            PackageCVE(cve, meta))
+        with span('cve_load'):
+            index = None if rebuild else self._load_pickle(self.index_path, key)
+            if index is not None:
+                incr('cache_hits', cache='cve_index')
+                cve_table, packages = index
+            else:
+                incr('cache_misses', cache='cve_index')
+                with open(self.data_file, 'r') as file_stream:
+                    data = json.load(file_stream)
+                packages, cve_table, reverse = build_index(data)
+                self._save_pickle(self.index_path, (
+                    pickle.dumps(cve_table, pickle.HIGHEST_PROTOCOL),
+                    {package: pickle.dumps(cves, pickle.HIGHEST_PROTOCOL)
+                     for package, cves in packages.items()},
+                ), key)
+                self._save_pickle(self.reverse_index_path, reverse, key)
 
         # Not rally sure if this dose what i want but trying to make the
         # operation as atomic as possible
         self.packages = packages
+        self._cve_table = cve_table
+        self._cves = {}
+        self._resolved = {}
+        self._reverse = None
+        self._changes = None
+        self.key = key
         packages = None
         data = None
+        return reverse
+
+    @property
+    def reverse_index(self):
+        """
+        Return the (cves, open_cves) reverse indexes, see build_index.
+        If data_file was replaced since it was loaded everything is reloaded
+        so the answers never mix the old and new data
+        """
+        if self._reverse is None:
+            with span('cve_reverse_load'):
+                reverse = self._load_pickle(self.reverse_index_path, self.key)
+            if reverse is None:
+                incr('cache_misses', cache='cve_reverse_index')
+                reverse = self.load_data(rebuild=True)
+            else:
+                incr('cache_hits', cache='cve_reverse_index')
+            self._reverse = reverse
+        return self._reverse
+
+    def get_cve(self, cve):
+        """
+        Return the PackageCVE for a resolved CVE, a single instance is shared
+        by every package and release referencing it
+        """
+        package_cve = self._cves.get(cve)
+        if package_cve is None:
+            if isinstance(self._cve_table, bytes):
+                self._cve_table = pickle.loads(self._cve_table)
+            scope, description = self._cve_table[cve]
+            package_cve = self._cves.setdefault(cve, PackageCVE(
+                cve, {'scope': scope, 'description': description}))
+        return package_cve
 
     def get_cves(self, package, check):
         """Return CVE's associated with a package"""
-        return self.packages.get(package, {}).get(check, None)
+        cves = self._resolved.get(package)
+        if cves is None:
+            cves = self.packages.get(package, {})
+            if isinstance(cves, bytes):
+                cves = pickle.loads(cves)
+            cves = self._resolved[package] = {
+                version: tuple(self.get_cve(cve) for cve in cve_ids)
+                for version, cve_ids in cves.items()
+            }
+        return cves.get(check, None)
+
+    def get_packages(self, cve):
+        """
+        Return the packages affected by a CVE as
+        {package: {release: (status, fixed_version)}}
+        """
+        return self.reverse_index[0].get(cve, None)
+
+    def get_open_cves(self, package, release=None):
+        """
+        Return the CVE's still open for a package as {release: (cve, ...)}
+        or just the tuple of CVE's if release is given
+        """
+        releases = self.reverse_index[1].get(package, {})
+        if release is not None:
+            return releases.get(release, ())
+        return releases
+
+    @property
+    def previous(self):
+        """Return the PackagesCVE for the data_file replaced by the last update"""
+        path = previous_path(self.data_file)
+        if not os.path.isfile(path):
+            return None
+        mtime = os.stat(path).st_mtime_ns
+        if self._previous is None or self._previous[0] != mtime:
+            self._previous = (mtime, PackagesCVE(path))
+        return self._previous[1]
+
+    def changes(self, previous=None):
+        """
+        Return the status changes since previous as a sorted list of
+        (cve, package, release, old, new) where old and new are
+        (status, fixed_version) tuples or None if the entry didn't exist.
+        The list is pickled next to data_file so it is only computed once
+        per tracker update
+        """
+        if previous is None:
+            previous = self.previous
+        key = (
+            self.key,
+            None if previous is None else os.path.abspath(previous.data_file),
+            None if previous is None else previous.key,
+        )
+        if self._changes is None or self._changes[0] != key:
+            with span('cve_changes'):
+                changes = self._load_pickle(self.changes_path, key)
+                if changes is None:
+                    incr('cache_misses', cache='cve_changes')
+                    changes = compute_changes(
+                        previous.reverse_index[0] if previous is not None else {},
+                        self.reverse_index[0],
+                    )
+                    self._save_pickle(self.changes_path, changes, key)
+                else:
+                    incr('cache_hits', cache='cve_changes')
+            self._changes = (key, changes)
+        return self._changes[1]
+
+
+def compute_changes(old_cves, new_cves):
+    """
+    Return the status changes between two {cve: {package: {release: state}}}
+    reverse indexes, see PackagesCVE.changes
+    """
+    changes = []
+    for cve in set(old_cves) | set(new_cves):
+        old_packages = old_cves.get(cve, {})
+        new_packages = new_cves.get(cve, {})
+        if old_packages == new_packages:
+            continue
+        for package in set(old_packages) | set(new_packages):
+            old_releases = old_packages.get(package, {})
+            new_releases = new_packages.get(package, {})
+            for release in set(old_releases) | set(new_releases):
+                old = old_releases.get(release)
+                new = new_releases.get(release)
+                if old != new:
+                    changes.append((cve, package, release, old, new))
+    return sorted(changes)
+
+
+def build_index(data):
+    """
+    Build the indexes from parsed tracker data, returns
+    (packages, cve_table, reverse)
+    packages: {package: {fixed_version: (cve, ...)}}
+    cve_table: {cve: (scope, description)} of the resolved CVE's
+    reverse: ({cve: {package: {release: (status, fixed_version)}}},
+              {package: {release: (cve, ...)}}) of the CVE's not resolved
+    """
+    cve_table = {}
+    packages = {}
+    cves_index = defaultdict(dict)
+    open_index = {}
+    for package, cves in data.items():
+        package = sys.intern(package)
+        versions = defaultdict(list)
+        open_cves = defaultdict(list)
+        for cve, meta in cves.items():
+            cve = sys.intern(cve)
+            releases = {}
+            for release, info in meta['releases'].items():
+                release = sys.intern(release)
+                status = sys.intern(info['status'])
+                fixed_version = info.get('fixed_version')
+                if fixed_version is not None:
+                    fixed_version = sys.intern(fixed_version)
+                releases[release] = (status, fixed_version)
+                if status == 'resolved':
+                    if cve not in cve_table:
+                        cve_table[cve] = (
+                            sys.intern(meta.get('scope', 'Uknown')),
+                            meta.get('description', 'Unknown'),
+                        )
+                    versions[fixed_version].append(cve)
+                else:
+                    open_cves[release].append(cve)
+            cves_index[cve][package] = releases
+        packages[package] = {
+            version: tuple(version_cves) for version, version_cves in versions.items()
+        }
+        if open_cves:
+            open_index[package] = {
+                release: tuple(release_cves)
+                for release, release_cves in open_cves.items()
+            }
+    return packages, cve_table, (dict(cves_index), open_index)
+
+
+def update_data_file(data_file, force=False):
+    """
+    Download the tracker data to data_file if it is missing or force is set.
+    The replaced file is kept as previous_path(data_file) so changes can be
+    reported, returns True if the file was downloaded
+    """
+    if os.path.isfile(data_file) and not force:
+        return False
+
+    with span('tracker_download'):
+        response = transport.get(SECURITY_TRACKERDATA_URL, cache=True)
+    if response.from_cache and os.path.isfile(data_file):
+        logging.getLogger('debcompare.PackagesCVE').info(
+            '%s has not changed', SECURITY_TRACKERDATA_URL)
+        return False
+    tmp_path = '{}.{}'.format(data_file, os.getpid())
+    with open(tmp_path, 'w') as file_stream:
+        json.dump(response.json(), file_stream)
+    if os.path.isfile(data_file):
+        # the indexes are keyed on the data file mtime and size which the
+        # link keeps, so the previous data doesn't need to be indexed again
+        for get_path in [index_path, reverse_index_path]:
+            if os.path.isfile(get_path(data_file)):
+                keep_copy(get_path(data_file), get_path(previous_path(data_file)))
+        keep_copy(data_file, previous_path(data_file))
+    # data_file is swapped in one step so readers always find a copy
+    os.replace(tmp_path, data_file)
+    return True
+
+
+def keep_copy(path, copy_path):
+    """Hard link path to copy_path, or copy it keeping its mtime"""
+    tmp_path = '{}.{}'.format(copy_path, os.getpid())
+    try:
+        os.link(path, tmp_path)
+    except OSError:
+        shutil.copy2(path, tmp_path)
+    os.replace(tmp_path, copy_path)
+
+
+def previous_path(data_file):
+    """Return the path the previous copy of data_file is kept at"""
+    return '{}.prev'.format(data_file)
+
+
+def index_path(data_file):
+    """Return the path of the pickled index for data_file"""
+    return '{}.index'.format(data_file)
+
+
+def reverse_index_path(data_file):
+    """Return the path of the pickled reverse indexes for data_file"""
+    return '{}.rindex'.format(data_file)
 
 
 class PackageCVE():
-    '''class to hold information about a CVE'''
+    '''
+    class to hold information about a CVE, a single instance is shared by
+    all the packages and releases referencing the CVE
+    '''
+    __slots__ = ('cve', 'scope', 'description', '_notes')
+
     def __init__(self, cve, info):
-        self.cve = cve
-        self.scope = info.get('scope', 'Uknown')
+        self.cve = sys.intern(cve)
+        self.scope = sys.intern(info.get('scope', 'Uknown'))
         self.description = info.get('description', 'Unknown')
         self._notes = None
 
@@ -67,24 +383,64 @@ class PackageCVE():
     def notes(self):
         """Return associated CVE notes"""
         if self._notes is None:
+            from debcompare.trackerscrape import Scrape
+
             scrape = Scrape(self.cve)
             self._notes = scrape.notes
         return self._notes
 
 
-def get_args():
-    """Argument parser"""
-    parser = ArgumentParser(description="list CVE's fixed in a specific packag")
-    parser.add_argument('-w', '--working-dir', default='/var/tmp/debcompare',
+COMMANDS = ['fixed', 'cve', 'open', 'changes']
+
+
+def add_common_args(parser, suppress=False):
+    """
+    Add the options shared by all sub commands, the sub command copies are
+    suppressed so they don't override the values given before the command
+    """
+    parser.add_argument('-w', '--working-dir',
+                        default=SUPPRESS if suppress else '/var/tmp/debcompare',
                         help='A directory to store downloaded files')
-    parser.add_argument('-c', '--check', required=True,
-                        help='the specific version to test')
     parser.add_argument('-f', '--force', action='store_true',
-                        help='the specific version to test')
+                        default=SUPPRESS if suppress else False,
+                        help='force a re-download of the tracker data')
     parser.add_argument('-v', '--verbose', action='count',
+                        default=SUPPRESS if suppress else None,
                         help='Add more to increase verbosity')
-    parser.add_argument('package', help='The package to compare')
-    return parser.parse_args()
+
+
+def get_args(argv=None):
+    """Argument parser"""
+    if argv is None:
+        argv = sys.argv[1:]
+    # without a sub command behave like the original fixed only cli
+    if not set(argv) & set(COMMANDS + ['-h', '--help']):
+        argv = ['fixed'] + argv
+    parser = ArgumentParser(description="query the debian security tracker data")
+    add_common_args(parser)
+    # the options can be given before or after the sub command
+    common = ArgumentParser(add_help=False)
+    add_common_args(common, suppress=True)
+    commands = parser.add_subparsers(dest='command')
+    commands.required = True
+    fixed = commands.add_parser('fixed', parents=[common],
+                                help="list CVE's fixed in a specific package version")
+    fixed.add_argument('-c', '--check', required=True,
+                       help='the specific version to test')
+    fixed.add_argument('package', help='The package to compare')
+    cve = commands.add_parser('cve', parents=[common],
+                              help='list the packages and releases affected by a CVE')
+    cve.add_argument('cve', help='the CVE ID')
+    open_cves = commands.add_parser('open', parents=[common],
+                                    help="list the CVE's still open for a package")
+    open_cves.add_argument('-r', '--release', help='only list this release')
+    open_cves.add_argument('package', help='The package to check')
+    changes = commands.add_parser(
+        'changes', parents=[common],
+        help='list status changes since the previous tracker data')
+    changes.add_argument('--since', help='the tracker data to compare against, '
+                         'the default is the copy kept by the last update')
+    return parser.parse_args(argv)
 
 
 def set_log_level(args_level):
@@ -100,22 +456,45 @@ def set_log_level(args_level):
     logging.basicConfig(level=log_level)
 
 
+def format_state(state):
+    """Format a (status, fixed_version) tuple"""
+    if state is None:
+        return '-'
+    status, fixed_version = state
+    return '{} {}'.format(status, fixed_version) if fixed_version else status
+
+
 def main():
     """Main entry point"""
     args = get_args()
     set_log_level(args.verbose)
     data_file = os.path.join(args.working_dir, 'cve.json')
-    if os.path.isfile(data_file):
-        if args.force:
-            os.remove(data_file)
-    if not os.path.isfile(data_file):
-        with open(data_file, 'w') as file_stream:
-            data = get(SECURITY_TRACKERDATA_URL).json()
-            json.dump(data, file_stream)
+    transport.configure(cache_dir=os.path.join(args.working_dir, 'http'))
+    update_data_file(data_file, args.force)
     packages = PackagesCVE(data_file)
-    cves = packages.get_cves(args.package, args.check)
-    for cve in cves:
-        print(str(cve))
+    if args.command == 'fixed':
+        for cve in packages.get_cves(args.package, args.check) or []:
+            print(str(cve))
+    elif args.command == 'cve':
+        for package, releases in sorted((packages.get_packages(args.cve) or {}).items()):
+            for release, state in sorted(releases.items()):
+                print('{} {}: {}'.format(package, release, format_state(state)))
+    elif args.command == 'open':
+        if args.release:
+            releases = {args.release: packages.get_open_cves(args.package, args.release)}
+        else:
+            releases = packages.get_open_cves(args.package)
+        for release, cves in sorted(releases.items()):
+            for cve in cves:
+                print('{} {}'.format(release, cve))
+    elif args.command == 'changes':
+        previous = PackagesCVE(args.since) if args.since else packages.previous
+        if previous is None:
+            logging.error('no previous tracker data to compare against')
+            raise SystemExit(1)
+        for cve, package, release, old, new in packages.changes(previous):
+            print('{} {} {}: {} -> {}'.format(
+                cve, package, release, format_state(old), format_state(new)))
 
 
 if __name__ == "__main__":
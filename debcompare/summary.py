@@ -0,0 +1,336 @@
+#!/usr/bin/env python3
+'''
+cheap summary of the differences between two source packages using the dsc
+checksums and tar member headers instead of a full debdiff
+'''
+import difflib
+import gzip
+import hashlib
+import logging
+import lzma
+import os
+import pickle
+import tarfile
+from collections import namedtuple
+from re import match
+
+from debcompare.compare import pickle_tofile, unpickle_file
+from debcompare.metrics import incr, span
+
+
+# bump this when the layout of the pickled member listings changes
+MEMBERS_VERSION = 1
+
+FileChange = namedtuple(
+    'FileChange', ['path', 'status', 'old_size', 'new_size', 'added', 'removed']
+)
+FileChange.__doc__ = '''
+a changed file, status is one of A(dded), D(eleted) or M(odified).
+added and removed are line counts and only set for the debian/ tree
+'''
+Member = namedtuple('Member', ['size', 'mtime', 'link'])
+
+
+def component(filename):
+    '''
+    return which part of a source package filename is: orig, orig-<name>,
+    debian, diff or native, None for the dsc and signatures
+    '''
+    found = match(r'.*?\.(orig(?:-[A-Za-z0-9-]+)?)\.tar\.\w+$', filename)
+    if found:
+        return found.group(1)
+    if match(r'.*\.debian\.tar\.\w+$', filename):
+        return 'debian'
+    if match(r'.*\.diff\.(gz|xz|bz2)$', filename):
+        return 'diff'
+    if match(r'.*\.tar\.\w+$', filename):
+        return 'native'
+    return None
+
+
+def strip_top_dir(name):
+    '''remove the top level directory of an upstream tarball member'''
+    return name.split('/', 1)[1] if '/' in name else name
+
+
+class TarListing:
+    '''
+    the member headers and content hashes of a tarball, cached in the working
+    directory and keyed by the tarball checksum so a listing is reused by
+    every version sharing the tarball
+    '''
+
+    def __init__(self, path, sha256, strip=True):
+        self.path = path
+        self.sha256 = sha256
+        self.strip = strip
+        self.cache_path = '{}.members'.format(path)
+        self.logger = logging.getLogger('debcompare.TarListing')
+        self.members = None
+        self.hashes = {}
+        # only diff.gz listings patch files they don't carry, see DiffListing
+        self.patched = {}
+        self._load()
+
+    def _name(self, name):
+        return strip_top_dir(name) if self.strip else name
+
+    def _load(self):
+        '''read the cached listing or list the tarball'''
+        try:
+            cached = unpickle_file(self.cache_path, False)
+        except (EOFError, ValueError, pickle.UnpicklingError):
+            cached = None
+        if cached is not None and cached[:2] == (MEMBERS_VERSION, self.sha256):
+            incr('cache_hits', cache='members')
+            self.members, self.hashes = cached[2:]
+            return
+        incr('cache_misses', cache='members')
+        self.members = {}
+        with span('tar_list'), tarfile.open(self.path, 'r|*') as tar:
+            for member in tar:
+                if member.isfile() or member.issym():
+                    self.members[self._name(member.name)] = Member(
+                        member.size, member.mtime, member.linkname or None)
+        self._save()
+
+    def _save(self):
+        try:
+            pickle_tofile(
+                (MEMBERS_VERSION, self.sha256, self.members, self.hashes),
+                self.cache_path,
+            )
+        except OSError as error:
+            self.logger.warning('unable to cache %s: %s', self.cache_path, error)
+
+    def read(self, names):
+        '''return {name: content} for the regular files in names'''
+        contents = {}
+        names = set(names)
+        with tarfile.open(self.path, 'r|*') as tar:
+            for member in tar:
+                name = self._name(member.name)
+                if name in names and member.isfile():
+                    contents[name] = tar.extractfile(member).read()
+        return contents
+
+    def hash(self, names):
+        '''return {name: sha256} for names, hashing the ones not cached yet'''
+        missing = [
+            name for name in names
+            if name not in self.hashes and self.members[name].link is None
+        ]
+        if missing:
+            with span('tar_hash'):
+                for name, content in self.read(missing).items():
+                    self.hashes[name] = hashlib.sha256(content).hexdigest()
+            self._save()
+        return {
+            name: self.members[name].link or self.hashes.get(name) for name in names
+        }
+
+
+class DiffListing:
+    '''
+    the files of a 1.0 format diff.gz: members are the files the diff creates
+    (@@ -0,0 hunks) with their content, patched are the files it modifies in
+    the orig tarball with a hash of their hunks, their size is unknown
+    without applying the diff
+    '''
+
+    def __init__(self, path):
+        self.path = path
+        self.contents = {}
+        self.patched = {}
+        _open = gzip.open if path.endswith('.gz') else lzma.open
+        with span('diff_list'), _open(path, 'r') as diff_file:
+            for name, created, lines in parse_diff(diff_file):
+                if created:
+                    self.contents[name] = b''.join(
+                        line[1:] for line in lines if line.startswith(b'+'))
+                else:
+                    self.patched[name] = hashlib.sha256(b''.join(lines)).hexdigest()
+        self.members = {
+            name: Member(len(content), None, None)
+            for name, content in self.contents.items()
+        }
+
+    def read(self, names):
+        '''return {name: content} for names'''
+        return {name: self.contents[name] for name in names}
+
+    def hash(self, names):
+        '''return {name: sha256} for names'''
+        return {
+            name: hashlib.sha256(self.contents[name]).hexdigest() for name in names
+        }
+
+
+def parse_diff(lines):
+    '''
+    yield (name, created, hunk_lines) for each file of a unified diff, created
+    is True if the file is new.  The hunk line counts are followed so content
+    lines starting with +++ or --- aren't mistaken for file headers
+    '''
+    name = None
+    created = None
+    hunk_lines = []
+    old_left = new_left = 0
+    for line in lines:
+        if line.startswith(b'\\'):
+            # "\ No newline at end of file" applies to the previous line
+            if hunk_lines and hunk_lines[-1].endswith(b'\n'):
+                hunk_lines[-1] = hunk_lines[-1][:-1]
+        elif old_left > 0 or new_left > 0:
+            if line.startswith(b'+'):
+                new_left -= 1
+            elif line.startswith(b'-'):
+                old_left -= 1
+            else:
+                old_left -= 1
+                new_left -= 1
+            hunk_lines.append(line)
+        elif line.startswith(b'+++ '):
+            if name is not None:
+                yield name, created, hunk_lines
+            name = strip_top_dir(line[4:].split(b'\t')[0].strip().decode())
+            created = None
+            hunk_lines = []
+        elif line.startswith(b'@@ ') and name is not None:
+            found = match(rb'@@ -(\d+)(?:,(\d+))? \+(\d+)(?:,(\d+))? @@', line)
+            if found is None:
+                continue
+            old_start, old_count, _, new_count = found.groups()
+            old_left = int(old_count) if old_count is not None else 1
+            new_left = int(new_count) if new_count is not None else 1
+            if created is None:
+                created = int(old_start) == 0 and old_left == 0
+    if name is not None:
+        yield name, created, hunk_lines
+
+
+def listing(package, filename):
+    '''return the listing of a source package file'''
+    path = os.path.join(package.working_dir, filename)
+    kind = component(filename)
+    if kind == 'diff':
+        return DiffListing(path)
+    return TarListing(path, package.checksums.get(filename), strip=kind != 'debian')
+
+
+def line_delta(old, new):
+    '''return the (added, removed) line counts between two contents'''
+    try:
+        old_lines = old.decode().splitlines() if old is not None else []
+        new_lines = new.decode().splitlines() if new is not None else []
+    except UnicodeDecodeError:
+        return None, None
+    added = removed = 0
+    matcher = difflib.SequenceMatcher(None, old_lines, new_lines, autojunk=False)
+    for tag, old_start, old_end, new_start, new_end in matcher.get_opcodes():
+        if tag in ('replace', 'delete'):
+            removed += old_end - old_start
+        if tag in ('replace', 'insert'):
+            added += new_end - new_start
+    return added, removed
+
+
+def compare_listings(old, new):
+    '''return the FileChanges between two listings'''
+    old_members = old.members if old is not None else {}
+    new_members = new.members if new is not None else {}
+    changes = {}
+    # files patched by a diff.gz are modified compared to the orig tarball
+    # whenever their hunks differ, their size is unknown
+    old_patched = old.patched if old is not None else {}
+    new_patched = new.patched if new is not None else {}
+    for name in set(old_patched) | set(new_patched):
+        if old_patched.get(name) != new_patched.get(name):
+            changes[name] = 'M'
+    for name in set(old_members) - set(new_members):
+        changes[name] = 'D'
+    for name in set(new_members) - set(old_members):
+        changes[name] = 'A'
+    same_size = []
+    for name in set(old_members) & set(new_members):
+        if old_members[name].size != new_members[name].size:
+            changes[name] = 'M'
+        else:
+            same_size.append(name)
+    if same_size:
+        old_hashes = old.hash(same_size)
+        new_hashes = new.hash(same_size)
+        for name in same_size:
+            if old_hashes[name] != new_hashes[name]:
+                changes[name] = 'M'
+
+    debian = [name for name in changes if name.startswith('debian/')]
+    old_contents = old.read([n for n in debian if n in old_members]) if old else {}
+    new_contents = new.read([n for n in debian if n in new_members]) if new else {}
+    result = []
+    for name, status in changes.items():
+        added = removed = None
+        if name in debian:
+            added, removed = line_delta(old_contents.get(name), new_contents.get(name))
+        result.append(FileChange(
+            name,
+            status,
+            old_members[name].size if name in old_members else None,
+            new_members[name].size if name in new_members else None,
+            added,
+            removed,
+        ))
+    return result
+
+
+def merge_changes(changes):
+    '''
+    merge the FileChanges reported for the same path by different components,
+    e.g. a file the old diff.gz created and the new orig tarball ships
+    '''
+    merged = {}
+    for change in changes:
+        other = merged.get(change.path)
+        if other is None:
+            merged[change.path] = change
+            continue
+        merged[change.path] = FileChange(
+            change.path,
+            change.status if change.status == other.status else 'M',
+            *[
+                first if first is not None else second
+                for first, second in zip(other[2:], change[2:])
+            ]
+        )
+    return sorted(merged.values())
+
+
+def summarize(old_package, new_package):
+    '''
+    return (unchanged, changes): the source package files with identical
+    checksums, which are never opened, and the sorted FileChanges
+    '''
+    old_files = {component(name): name for name in old_package.additional_files}
+    new_files = {component(name): name for name in new_package.additional_files}
+    old_files.pop(None, None)
+    new_files.pop(None, None)
+    unchanged = []
+    changes = []
+    with span('summary'):
+        for kind in sorted(set(old_files) | set(new_files)):
+            old_name = old_files.get(kind)
+            new_name = new_files.get(kind)
+            if (
+                old_name is not None
+                and new_name is not None
+                and old_package.checksums.get(old_name) is not None
+                and old_package.checksums.get(old_name)
+                == new_package.checksums.get(new_name)
+            ):
+                unchanged.append(new_name)
+                continue
+            changes.extend(compare_listings(
+                listing(old_package, old_name) if old_name else None,
+                listing(new_package, new_name) if new_name else None,
+            ))
+    return unchanged, merge_changes(changes)
@@ -3,8 +3,8 @@
 
 from argparse import ArgumentParser
 
-from bs4 import BeautifulSoup
-from requests import get
+from debcompare import transport
+from debcompare.metrics import span
 
 
 TRACKER_URI = 'https://security-tracker.debian.org/tracker/{bug}'
@@ -28,13 +28,16 @@ class Scrape():
     def content(self):
         """return the raw page content"""
         if self._content is None:
-            self._content = get(self.uri).text
+            with span('scrape'):
+                self._content = transport.get(self.uri, cache=True).text
         return self._content
 
     @property
     def notes(self):
         """return the notes from a given page"""
         if self._notes is None:
+            from bs4 import BeautifulSoup
+
             parsed = BeautifulSoup(self.content, 'html.parser')
             notes = parsed.find('h2', text='Notes')
             if notes:
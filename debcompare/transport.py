@@ -0,0 +1,221 @@
+#!/usr/bin/env python3
+'''
+shared http transport used for every external call: a pooled keep-alive
+session with uniform timeouts and retries, a per host token bucket rate limit
+and an optional on disk cache revalidated with ETag/Last-Modified
+'''
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from urllib.parse import urlparse
+
+from debcompare.metrics import incr, span
+
+
+DEFAULT_TIMEOUT = 10
+DEFAULT_POOL_SIZE = 16
+# (requests per second, burst) per host, snapshot.debian.org throttles
+# aggressive clients so keep well below its limits
+DEFAULT_RATE_LIMIT = (10.0, 20)
+RATE_LIMITS = {
+    'snapshot.debian.org': (5.0, 10),
+    'bugs.debian.org': (5.0, 10),
+}
+
+
+class TokenBucket:
+    '''thread safe token bucket, acquire blocks until a token is available'''
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        '''take a token, return the number of seconds spent waiting'''
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= 1
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0
+        if wait:
+            time.sleep(wait)
+        return wait
+
+
+class Transport:
+    '''pooled, rate limited and cached http client'''
+
+    # pylint: disable=too-many-instance-attributes
+    # pylint: disable=too-many-arguments
+
+    _session = None
+
+    def __init__(
+        self,
+        timeout=DEFAULT_TIMEOUT,
+        retries=5,
+        pool_size=DEFAULT_POOL_SIZE,
+        rate_limits=None,
+        cache_dir=None,
+    ):
+        self.timeout = timeout
+        self.retries = retries
+        self.pool_size = pool_size
+        self.rate_limits = dict(RATE_LIMITS, **(rate_limits or {}))
+        self.cache_dir = cache_dir
+        self.logger = logging.getLogger('debcompare.Transport')
+        self._lock = threading.Lock()
+        self._buckets = {}
+
+    @property
+    def session(self):
+        '''the shared requests session, created on first use'''
+        with self._lock:
+            if self._session is None:
+                from requests import Session
+                from requests.adapters import HTTPAdapter, Retry
+
+                session = Session()
+                retries = Retry(
+                    total=self.retries,
+                    backoff_factor=0.5,
+                    status_forcelist=[429, 500, 502, 503, 504],
+                    respect_retry_after_header=True,
+                )
+                adapter = HTTPAdapter(
+                    pool_connections=self.pool_size,
+                    pool_maxsize=self.pool_size,
+                    max_retries=retries,
+                )
+                session.mount('http://', adapter)
+                session.mount('https://', adapter)
+                self._session = session
+            return self._session
+
+    def throttle(self, host):
+        '''wait for the rate limit of host'''
+        with self._lock:
+            bucket = self._buckets.get(host)
+            if bucket is None:
+                rate, capacity = self.rate_limits.get(host, DEFAULT_RATE_LIMIT)
+                bucket = self._buckets[host] = TokenBucket(rate, capacity)
+        wait = bucket.acquire()
+        if wait:
+            incr('http_throttled_seconds', wait, host=host)
+
+    def _cache_paths(self, url):
+        '''return the (meta, body) cache paths for url'''
+        key = hashlib.sha256(url.encode()).hexdigest()
+        return (
+            os.path.join(self.cache_dir, '{}.meta'.format(key)),
+            os.path.join(self.cache_dir, '{}.body'.format(key)),
+        )
+
+    def _cached(self, url):
+        '''return the cached (meta, body) for url or (None, None)'''
+        meta_path, body_path = self._cache_paths(url)
+        try:
+            with open(meta_path, 'r') as meta_file:
+                meta = json.load(meta_file)
+            with open(body_path, 'rb') as body_file:
+                return meta, body_file.read()
+        except (OSError, ValueError):
+            return None, None
+
+    def _store(self, url, response):
+        '''cache response if it can be revalidated'''
+        meta = {
+            'url': url,
+            'etag': response.headers.get('ETag'),
+            'last_modified': response.headers.get('Last-Modified'),
+        }
+        if not meta['etag'] and not meta['last_modified']:
+            return
+        meta_path, body_path = self._cache_paths(url)
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            tmp_path = '{}.{}'.format(body_path, threading.get_ident())
+            with open(tmp_path, 'wb') as body_file:
+                body_file.write(response.content)
+            os.replace(tmp_path, body_path)
+            with open(meta_path, 'w') as meta_file:
+                json.dump(meta, meta_file)
+        except OSError as error:
+            self.logger.warning('unable to cache %s: %s', url, error)
+
+    def get(self, url, cache=False, **kwargs):
+        '''
+        GET url and return the requests.Response. With cache the response is
+        stored on disk and revalidated with a conditional request, a 304 is
+        answered from the cache and the response gets from_cache = True
+        '''
+        host = urlparse(url).hostname
+        kwargs.setdefault('timeout', self.timeout)
+        cache = cache and self.cache_dir is not None
+        meta, body = self._cached(url) if cache else (None, None)
+        if meta is not None:
+            headers = dict(kwargs.pop('headers', None) or {})
+            if meta.get('etag'):
+                headers['If-None-Match'] = meta['etag']
+            if meta.get('last_modified'):
+                headers['If-Modified-Since'] = meta['last_modified']
+            kwargs['headers'] = headers
+
+        self.throttle(host)
+        with span('http_get', host=host):
+            response = self.session.get(url, **kwargs)
+        incr('http_requests', host=host, status=response.status_code)
+
+        response.from_cache = False
+        if meta is not None and response.status_code == 304:
+            incr('cache_hits', cache='http')
+            # pylint: disable=protected-access
+            response._content = body
+            response.status_code = 200
+            response.from_cache = True
+        else:
+            incr('http_bytes', len(response.content), host=host)
+            if cache:
+                incr('cache_misses', cache='http')
+                if response.status_code == 200:
+                    self._store(url, response)
+        return response
+
+
+TRANSPORT = Transport()
+
+
+def configure(**settings):
+    '''
+    change the settings of the shared transport, the session and rate limits
+    are recreated on the next request if their settings changed
+    '''
+    # pylint: disable=protected-access
+    for name, value in settings.items():
+        if not hasattr(TRANSPORT, name):
+            raise TypeError('unknown transport setting: {}'.format(name))
+        if name == 'rate_limits':
+            value = dict(RATE_LIMITS, **value)
+        setattr(TRANSPORT, name, value)
+    with TRANSPORT._lock:
+        if {'retries', 'pool_size'} & set(settings):
+            TRANSPORT._session = None
+        if 'rate_limits' in settings:
+            TRANSPORT._buckets = {}
+
+
+def get(url, cache=False, **kwargs):
+    '''GET url using the shared transport'''
+    return TRANSPORT.get(url, cache, **kwargs)
+
+
+def throttle(host):
+    '''wait for the rate limit of host using the shared transport'''
+    TRANSPORT.throttle(host)
@@ -3,7 +3,8 @@ import os
 from flask import Flask
 import logging
 from flask_bootstrap import Bootstrap
-from debcompare.web import tasks, compare
+from debcompare import transport
+from debcompare.web import tasks, compare, cves, metrics
 from debcompare.compare import PackagesCVE
 
 
@@ -24,8 +25,18 @@ def create_app(test_config=None):
     except OSError:
         pass
 
+    transport.configure(cache_dir=app.config.get('HTTP_CACHE_DIR'))
     app.register_blueprint(compare.bp)
+    app.register_blueprint(cves.bp)
+    app.register_blueprint(metrics.bp)
     tasks.update_cves_file(app.config['PACKAGES_CVE_FILE'])
     app.packages_cve = PackagesCVE(app.config['PACKAGES_CVE_FILE'])
 
+    @app.before_request
+    def reload_packages_cve():
+        '''pick up the tracker data replaced by update-cves in another process'''
+        if app.packages_cve.stale:
+            app.logger.info('reloading %s', app.config['PACKAGES_CVE_FILE'])
+            app.packages_cve = PackagesCVE(app.config['PACKAGES_CVE_FILE'])
+
     return app
@@ -17,3 +17,16 @@ def compare(source_pkg, old_version, new_version):
         fixed_cves,
     )
     return render_template('compare.html', differ=differ)
+
+
+@bp.route('<source_pkg>/<old_version>/<new_version>/summary')
+def summary(source_pkg, old_version, new_version):
+    '''summarise the changed files without running debdiff'''
+    differ = Differ(source_pkg, old_version, new_version, None)
+    unchanged, changes = differ.summary
+    return jsonify(
+        {
+            'unchanged': unchanged,
+            'changes': [change._asdict() for change in changes],
+        }
+    )
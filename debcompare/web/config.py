@@ -2,3 +2,7 @@ import os
 
 WORKING_DIR = '/var/tmp/debcompare'
 PACKAGES_CVE_FILE = os.path.join(WORKING_DIR, 'cve.json')
+HTTP_CACHE_DIR = os.path.join(WORKING_DIR, 'http')
+PREFETCH_CONCURRENCY = 2
+# bytes, None for no limit
+PREFETCH_DISK_BUDGET = None
@@ -0,0 +1,52 @@
+from flask import Blueprint, abort, current_app, jsonify
+
+
+bp = Blueprint('cves', __name__, url_prefix='/cves')
+
+
+@bp.route('<cve_id>')
+def cve(cve_id):
+    '''packages and releases affected by a CVE'''
+    packages = current_app.packages_cve.get_packages(cve_id)
+    if packages is None:
+        abort(404)
+    return jsonify(
+        {
+            package: {
+                release: {'status': status, 'fixed_version': fixed_version}
+                for release, (status, fixed_version) in releases.items()
+            }
+            for package, releases in packages.items()
+        }
+    )
+
+
+@bp.route('open/<source_pkg>')
+@bp.route('open/<source_pkg>/<release>')
+def open_cves(source_pkg, release=None):
+    '''CVEs still open for a package'''
+    if release is not None:
+        return jsonify({release: current_app.packages_cve.get_open_cves(source_pkg, release)})
+    return jsonify(current_app.packages_cve.get_open_cves(source_pkg))
+
+
+@bp.route('changes')
+def changes():
+    '''status changes since the previous tracker update'''
+    previous = current_app.packages_cve.previous
+    if previous is None:
+        abort(404)
+    return jsonify(
+        [
+            {
+                'cve': cve_id,
+                'package': package,
+                'release': release,
+                'old': dict(zip(['status', 'fixed_version'], old)) if old else None,
+                'new': dict(zip(['status', 'fixed_version'], new)) if new else None,
+            }
+            for cve_id, package, release, old, new in current_app.packages_cve.changes(
+                previous
+            )
+        ]
+    )
@@ -0,0 +1,11 @@
+from flask import Blueprint, Response
+from debcompare.metrics import METRICS
+
+
+bp = Blueprint('metrics', __name__)
+
+
+@bp.route('/metrics')
+def metrics():
+    '''expose timings and counters in the prometheus text format'''
+    return Response(METRICS.prometheus(), mimetype='text/plain; version=0.0.4')
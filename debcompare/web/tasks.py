@@ -1,23 +1,28 @@
 '''clie tasks that affect the web app'''
-import os
-import json
 import click
-from requests import get
 from flask import current_app
 from flask.cli import with_appcontext
-from debcompare.secinfo import SECURITY_TRACKERDATA_URL
+from debcompare.prefetch import Prefetcher, new_fixed_versions
+from debcompare.secinfo import update_data_file
 
 
-def update_cves_file(cve_file):
+def update_cves_file(cve_file, force=False):
     '''command to update the cve data probably run via cron'''
-    if not os.path.isfile(cve_file):
-        with open(cve_file, 'w') as cve_fh:
-            data = get(SECURITY_TRACKERDATA_URL).json()
-            json.dump(data, cve_fh)
+    return update_data_file(cve_file, force)
 
 
 @click.command('update-cves')
 @with_appcontext
 def click_update_cves():
-    update_cves_file()
-    return current_app.packages_cve.load_data(current_app.config['PACKAGES_CVE_FILE'])
+    if not update_cves_file(current_app.config['PACKAGES_CVE_FILE'], force=True):
+        return None
+    packages_cve = current_app.packages_cve
+    packages_cve.load_data()
+    prefetcher = Prefetcher(
+        packages_cve,
+        current_app.config['WORKING_DIR'],
+        current_app.config['PREFETCH_CONCURRENCY'],
+        current_app.config['PREFETCH_DISK_BUDGET'],
+    )
+    prefetcher.schedule(new_fixed_versions(packages_cve, packages_cve.previous))
+    return prefetcher.shutdown()
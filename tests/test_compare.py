@@ -0,0 +1,31 @@
+'''tests for debcompare.compare'''
+import os
+import subprocess
+import sys
+
+from debcompare.compare import next_version, previous_version
+
+
+def test_previous_version():
+    assert previous_version('1.0-1+deb9u2') == '1.0-1+deb9u1'
+    assert previous_version('7.38.0-4+deb8u11') == '7.38.0-4+deb8u10'
+    assert previous_version('1.0-1+deb9u1') == '1.0-1'
+    assert previous_version('1.0-1') is None
+
+
+def test_next_version():
+    assert next_version('1.0-1+deb9u1') == '1.0-1+deb9u2'
+    assert next_version('7.38.0-4+deb8u9') == '7.38.0-4+deb8u10'
+    assert next_version('1.0-1') is None
+
+
+def test_heavy_modules_imported_lazily():
+    # the cli startup budget depends on these only being imported when used
+    heavy = ['requests', 'debianbts', 'debian.changelog', 'bs4', 'fabulous']
+    result = subprocess.run(
+        [sys.executable, '-c',
+         'import sys, debcompare.compare; print(" ".join(sorted(sys.modules)))'],
+        check=True, stdout=subprocess.PIPE, universal_newlines=True,
+        cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    )
+    assert set(heavy).isdisjoint(result.stdout.split())
@@ -0,0 +1,67 @@
+'''tests for debcompare.daemon'''
+import threading
+
+from debcompare import daemon
+
+
+class FakeDiffer:
+    '''stand in for Differ that doesn't download anything'''
+
+    instances = 0
+
+    def __init__(self, name, old_version, new_version, fixed_cves, force, working_dir):
+        # pylint: disable=too-many-arguments
+        FakeDiffer.instances += 1
+        self.fixed_cves = fixed_cves
+
+
+def test_differ_is_cached(monkeypatch):
+    monkeypatch.setattr(daemon, 'Differ', FakeDiffer)
+    FakeDiffer.instances = 0
+    state = daemon.State(max_differs=1)
+    with state.differ('curl', '1', '2', ('CVE-1',), False, '/tmp') as first:
+        pass
+    with state.differ('curl', '1', '2', None, False, '/tmp') as second:
+        assert second is first
+        assert second.fixed_cves is None
+    with state.differ('wget', '1', '2', None, False, '/tmp'):
+        pass
+    # curl was evicted
+    with state.differ('curl', '1', '2', None, False, '/tmp') as third:
+        assert third is not first
+    assert FakeDiffer.instances == 3
+
+
+def test_differ_fixed_cves_not_overwritten(monkeypatch):
+    monkeypatch.setattr(daemon, 'Differ', FakeDiffer)
+    state = daemon.State()
+    waiting = threading.Event()
+    seen = []
+
+    def diff_only():
+        waiting.set()
+        with state.differ('curl', '1', '2', None, False, '/tmp') as differ:
+            seen.append(('diff_only', differ.fixed_cves))
+
+    with state.differ('curl', '1', '2', ('CVE-1',), False, '/tmp') as differ:
+        thread = threading.Thread(target=diff_only)
+        thread.start()
+        waiting.wait()
+        thread.join(0.2)
+        # the diff only request waits for the full report to be rendered
+        seen.append(('full', differ.fixed_cves))
+    thread.join()
+    assert seen == [('full', ('CVE-1',)), ('diff_only', None)]
+
+
+def test_refresh_holds_tracker_lock(monkeypatch, tmp_path):
+    state = daemon.State()
+    locked = []
+
+    def update_data_file(data_file, force):
+        locked.append(state._tracker_lock.locked())  # pylint: disable=protected-access
+        return False
+
+    monkeypatch.setattr(daemon, 'update_data_file', update_data_file)
+    assert state.refresh(str(tmp_path)) is None
+    assert locked == [True]
@@ -0,0 +1,47 @@
+'''tests for debcompare.metrics'''
+import threading
+
+from debcompare.metrics import METRICS, Metrics, collect, incr, span
+
+
+def test_prometheus():
+    metrics = Metrics()
+    metrics.observe('download', 0.5)
+    metrics.observe('download', 1.5)
+    metrics.incr('cache_hits', cache='diff')
+    metrics.incr('cache_hits', 2, cache='diff')
+    metrics.incr('http_requests', host='snapshot.debian.org', status=200)
+    assert metrics.prometheus().splitlines() == [
+        '# HELP debcompare_span_seconds time spent in each stage',
+        '# TYPE debcompare_span_seconds summary',
+        'debcompare_span_seconds_sum{span="download"} 2.0',
+        'debcompare_span_seconds_count{span="download"} 2',
+        '# TYPE debcompare_cache_hits_total counter',
+        'debcompare_cache_hits_total{cache="diff"} 3',
+        '# TYPE debcompare_http_requests_total counter',
+        'debcompare_http_requests_total{host="snapshot.debian.org",status="200"} 1',
+    ]
+
+
+def test_prometheus_escapes_labels():
+    metrics = Metrics(prefix='test')
+    metrics.incr('errors', reason='say "no"')
+    assert 'test_errors_total{reason="say \\"no\\""} 1' in metrics.prometheus()
+
+
+def test_collect_isolation():
+    other_thread = threading.Thread(target=incr, args=('downloads',))
+    with collect() as outer:
+        incr('downloads')
+        with span('debdiff'):
+            pass
+        # recorded in another thread, so not part of this request
+        other_thread.start()
+        other_thread.join()
+        with collect() as inner:
+            incr('downloads', 2)
+    incr('downloads')
+    assert outer.counters == {('downloads', ()): 1}
+    assert list(outer.spans) == [('debdiff', ())]
+    assert inner.counters == {('downloads', ()): 2}
+    assert METRICS.counters[('downloads', ())] >= 5
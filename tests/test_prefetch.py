@@ -0,0 +1,103 @@
+'''tests for debcompare.prefetch'''
+from contextlib import nullcontext
+
+from debcompare import prefetch
+from debcompare.metrics import collect
+from debcompare.prefetch import Prefetcher, new_fixed_versions, parse_size
+
+
+class FakePackagesCVE:
+    '''stand in returning canned changes'''
+
+    def __init__(self, changes):
+        self._changes = changes
+
+    def changes(self, previous):
+        '''return the canned changes'''
+        return self._changes
+
+    def get_cves(self, package, version):
+        '''no CVE's'''
+        return ()
+
+
+class FakeDiffer:
+    '''records what warm asked for'''
+
+    def __init__(self, name, old_version, new_version, fixed_cves):
+        self.args = (name, old_version, new_version, fixed_cves)
+        self.security_bugs = []
+        self.reports = 0
+
+    def cli_report(self, color, output):
+        '''pretend to render the report'''
+        self.reports += 1
+
+
+def test_new_fixed_versions():
+    packages_cve = FakePackagesCVE([
+        ('CVE-1', 'curl', 'buster', ('open', None), ('resolved', '1.0-1+deb10u1')),
+        ('CVE-2', 'curl', 'buster', None, ('resolved', '1.0-1+deb10u1')),
+        ('CVE-3', 'curl', 'stretch', ('resolved', '1.0-1'), None),
+        ('CVE-4', 'wget', 'buster', None, ('open', None)),
+        ('CVE-5', 'zsh', 'buster', None, ('resolved', None)),
+    ])
+    assert new_fixed_versions(packages_cve, object()) == [('curl', '1.0-1+deb10u1')]
+    assert new_fixed_versions(packages_cve, None) == []
+
+
+def test_parse_size():
+    assert parse_size('512') == 512
+    assert parse_size('2K') == 2048
+    assert parse_size('1.5g') == 3 * 2 ** 29
+
+
+def prefetcher(tmp_path, differs, **kwargs):
+    '''return a Prefetcher using FakeDiffers collected in differs'''
+    def get_differ(*args):
+        differs.append(FakeDiffer(*args))
+        return nullcontext(differs[-1])
+
+    return Prefetcher(FakePackagesCVE([]), str(tmp_path), 1, get_differ=get_differ,
+                      **kwargs)
+
+
+def test_warm(tmp_path):
+    differs = []
+    with collect() as metrics:
+        assert prefetcher(tmp_path, differs).warm('curl', '1.0-1+deb10u2')
+    assert [differ.args for differ in differs] == [
+        ('curl', '1.0-1+deb10u1', '1.0-1+deb10u2', ())]
+    assert differs[0].reports == 1
+    assert metrics.counters[('prefetch', (('result', 'warmed'),))] == 1
+
+
+def test_warm_over_budget(tmp_path):
+    (tmp_path / 'cached.diff').write_bytes(b'x' * 100)
+    differs = []
+    with collect() as metrics:
+        assert not prefetcher(tmp_path, differs, disk_budget=100).warm(
+            'curl', '1.0-1+deb10u2')
+        assert prefetcher(tmp_path, differs, disk_budget=101).warm(
+            'curl', '1.0-1+deb10u2')
+    assert len(differs) == 1
+    assert metrics.counters[('prefetch', (('result', 'skipped'),))] == 1
+
+
+def test_warm_unknown_previous_version(tmp_path, monkeypatch):
+    monkeypatch.setattr(prefetch, 'snapshot_previous_version', lambda *args: None)
+    differs = []
+    with collect() as metrics:
+        assert not prefetcher(tmp_path, differs).warm('curl', '1.0-1')
+    assert differs == []
+    assert metrics.counters[('prefetch', (('result', 'skipped'),))] == 1
+
+
+def test_warm_failure(tmp_path):
+    def get_differ(*args):
+        raise RuntimeError('snapshot is down')
+
+    with collect() as metrics:
+        assert not Prefetcher(FakePackagesCVE([]), str(tmp_path),
+                              get_differ=get_differ).warm('curl', '1.0-1+deb10u2')
+    assert metrics.counters[('prefetch', (('result', 'failed'),))] == 1
@@ -0,0 +1,171 @@
+'''tests for the security tracker indexes in debcompare.secinfo'''
+import json
+import os
+from types import SimpleNamespace
+
+from debcompare import secinfo
+from debcompare.metrics import collect
+from debcompare.secinfo import (
+    PackagesCVE, build_index, compute_changes, get_args, update_data_file,
+)
+
+
+def tracker_cve(description, **releases):
+    '''return a tracker entry, releases map to (status, fixed_version)'''
+    entry = {'scope': 'remote', 'description': description, 'releases': {}}
+    for release, (status, fixed_version) in releases.items():
+        entry['releases'][release] = {'status': status}
+        if fixed_version is not None:
+            entry['releases'][release]['fixed_version'] = fixed_version
+    return entry
+
+
+DATA = {
+    'curl': {
+        'CVE-2018-1': tracker_cve('overflow', buster=('resolved', '1.0-2'),
+                                  stretch=('open', None)),
+        'CVE-2018-2': tracker_cve('leak', buster=('resolved', '1.0-2')),
+    },
+    'wget': {
+        'CVE-2018-1': tracker_cve('overflow', buster=('resolved', '2.0-1')),
+    },
+}
+
+
+def test_build_index():
+    packages, cve_table, (cves, open_cves) = build_index(DATA)
+    assert packages == {
+        'curl': {'1.0-2': ('CVE-2018-1', 'CVE-2018-2')},
+        'wget': {'2.0-1': ('CVE-2018-1',)},
+    }
+    assert cve_table == {
+        'CVE-2018-1': ('remote', 'overflow'),
+        'CVE-2018-2': ('remote', 'leak'),
+    }
+    assert cves['CVE-2018-1'] == {
+        'curl': {'buster': ('resolved', '1.0-2'), 'stretch': ('open', None)},
+        'wget': {'buster': ('resolved', '2.0-1')},
+    }
+    assert open_cves == {'curl': {'stretch': ('CVE-2018-1',)}}
+
+
+def test_compute_changes():
+    _, _, (old_cves, _) = build_index(DATA)
+    data = json.loads(json.dumps(DATA))
+    data['curl']['CVE-2018-1']['releases']['stretch'] = {
+        'status': 'resolved', 'fixed_version': '1.0-1+deb9u1'}
+    del data['wget']
+    data['zsh'] = {'CVE-2018-3': tracker_cve('crash', buster=('open', None))}
+    _, _, (new_cves, _) = build_index(data)
+    assert compute_changes(old_cves, new_cves) == [
+        ('CVE-2018-1', 'curl', 'stretch', ('open', None),
+         ('resolved', '1.0-1+deb9u1')),
+        ('CVE-2018-1', 'wget', 'buster', ('resolved', '2.0-1'), None),
+        ('CVE-2018-3', 'zsh', 'buster', None, ('open', None)),
+    ]
+    assert compute_changes(new_cves, new_cves) == []
+
+
+def test_shared_cves(tmp_path):
+    data_file = tmp_path / 'cve.json'
+    data_file.write_text(json.dumps(DATA))
+    # the first load builds the index, the second one reads it
+    for _ in range(2):
+        packages_cve = PackagesCVE(str(data_file))
+        curl = packages_cve.get_cves('curl', '1.0-2')
+        wget = packages_cve.get_cves('wget', '2.0-1')
+        assert [cve.cve for cve in curl] == ['CVE-2018-1', 'CVE-2018-2']
+        assert curl[0] is wget[0]
+        assert packages_cve.get_cves('curl', '9.9') is None
+
+
+def test_changes_since_previous(tmp_path):
+    previous_file = tmp_path / 'cve.json.prev'
+    previous_file.write_text(json.dumps({'wget': DATA['wget']}))
+    data_file = tmp_path / 'cve.json'
+    data_file.write_text(json.dumps(DATA))
+    packages_cve = PackagesCVE(str(data_file))
+    changes = packages_cve.changes()
+    assert [change[:3] for change in changes] == [
+        ('CVE-2018-1', 'curl', 'buster'),
+        ('CVE-2018-1', 'curl', 'stretch'),
+        ('CVE-2018-2', 'curl', 'buster'),
+    ]
+    # the second instance reads the change list saved by the first
+    assert PackagesCVE(str(data_file)).changes() == changes
+
+
+def test_reverse_index_loaded_on_demand(tmp_path):
+    data_file = tmp_path / 'cve.json'
+    data_file.write_text(json.dumps(DATA))
+    packages_cve = PackagesCVE(str(data_file))
+    # the cold build doesn't keep the reverse indexes in memory
+    assert packages_cve._reverse is None  # pylint: disable=protected-access
+    assert packages_cve.get_open_cves('curl') == {'stretch': ('CVE-2018-1',)}
+    os.remove(secinfo.reverse_index_path(str(data_file)))
+    assert sorted(packages_cve.get_packages('CVE-2018-1')) == ['curl', 'wget']
+
+
+def test_update_data_file(tmp_path, monkeypatch):
+    data_file = tmp_path / 'cve.json'
+    data_file.write_text(json.dumps({'wget': DATA['wget']}))
+    old = PackagesCVE(str(data_file))
+    monkeypatch.setattr(secinfo.transport, 'get', lambda url, cache: SimpleNamespace(
+        from_cache=False, json=lambda: DATA))
+    assert not update_data_file(str(data_file))
+    assert update_data_file(str(data_file), force=True)
+    assert old.stale
+    assert json.loads(data_file.read_text()) == DATA
+    previous = PackagesCVE(str(data_file)).previous
+    # the index kept with the previous copy is reused
+    assert previous.key == old.key
+    assert previous.get_cves('wget', '2.0-1')[0].cve == 'CVE-2018-1'
+    # a data file missing mid update isn't reported as stale
+    os.remove(str(data_file))
+    assert not old.stale
+
+
+def test_get_args_defaults():
+    args = get_args(['curl', '-c', '1.0-2'])
+    assert (args.command, args.force, args.working_dir, args.verbose) == (
+        'fixed', False, '/var/tmp/debcompare', None)
+    args = get_args(['-f', '-w', '/tmp/x', 'open', 'curl', '-vv'])
+    assert (args.command, args.force, args.working_dir, args.verbose) == (
+        'open', True, '/tmp/x', 2)
+
+
+def test_index_reused_until_data_changes(tmp_path):
+    data_file = tmp_path / 'cve.json'
+    data_file.write_text(json.dumps(DATA))
+    with collect() as metrics:
+        PackagesCVE(str(data_file))
+        PackagesCVE(str(data_file))
+    assert metrics.counters[('cache_misses', (('cache', 'cve_index'),))] == 1
+    assert metrics.counters[('cache_hits', (('cache', 'cve_index'),))] == 1
+    data_file.write_text(json.dumps({'wget': DATA['wget']}))
+    os.utime(str(data_file), ns=(0, 0))
+    # a changed data file invalidates the index
+    assert PackagesCVE(str(data_file)).get_cves('curl', '1.0-2') is None
+
+
+def test_notes_scraped_once_per_cve(tmp_path, monkeypatch):
+    scraped = []
+
+    class FakeScrape:
+        '''records the CVE's scraped'''
+
+        def __init__(self, cve):
+            scraped.append(cve)
+            self.notes = ['https://example.org/{}'.format(cve)]
+
+    monkeypatch.setattr('debcompare.trackerscrape.Scrape', FakeScrape)
+    data_file = tmp_path / 'cve.json'
+    data_file.write_text(json.dumps(DATA))
+    PackagesCVE(str(data_file))
+    # a warm load shares the records between packages too
+    packages_cve = PackagesCVE(str(data_file))
+    for package, version in [('curl', '1.0-2'), ('wget', '2.0-1')]:
+        for cve in packages_cve.get_cves(package, version):
+            assert cve.notes == ['https://example.org/{}'.format(cve.cve)]
+            assert not hasattr(cve, '__dict__')
+    assert sorted(scraped) == ['CVE-2018-1', 'CVE-2018-2']
@@ -0,0 +1,100 @@
+'''tests for debcompare.summary'''
+import gzip
+import io
+import tarfile
+
+from debcompare.summary import (
+    DiffListing, FileChange, TarListing, compare_listings, component, line_delta,
+    merge_changes,
+)
+
+
+def write_tarball(path, files):
+    '''write a tarball with files {name: content} under a top level directory'''
+    with tarfile.open(str(path), 'w:gz') as tar:
+        for name, content in files.items():
+            info = tarfile.TarInfo('pkg-1.0/{}'.format(name))
+            info.size = len(content)
+            tar.addfile(info, io.BytesIO(content))
+    return TarListing(str(path), str(sorted(files.items())))
+
+
+def write_diff(path, diff):
+    '''write a gzipped diff'''
+    with gzip.open(str(path), 'wb') as diff_file:
+        diff_file.write(diff.encode())
+    return DiffListing(str(path))
+
+
+def test_component():
+    assert component('curl_7.38.0.orig.tar.gz') == 'orig'
+    assert component('foo_1.0.orig-docs.tar.xz') == 'orig-docs'
+    assert component('curl_7.38.0-4+deb8u11.debian.tar.xz') == 'debian'
+    assert component('zlib_1.2.8.dfsg-2.diff.gz') == 'diff'
+    assert component('dpkg_1.18.25.tar.xz') == 'native'
+    assert component('curl_7.38.0-4+deb8u11.dsc') is None
+
+
+def test_line_delta():
+    assert line_delta(b'a\nb\nc\n', b'a\nB\nc\nd\n') == (2, 1)
+    assert line_delta(None, b'a\nb\n') == (2, 0)
+    assert line_delta(b'a\n', None) == (0, 1)
+    assert line_delta(b'\xff', b'a') == (None, None)
+
+
+def test_compare_tarballs(tmp_path):
+    old = write_tarball(tmp_path / 'old.tar.gz', {
+        'same': b'abc', 'gone': b'x', 'grown': b'ab', 'edited': b'abc',
+    })
+    new = write_tarball(tmp_path / 'new.tar.gz', {
+        'same': b'abc', 'added': b'xy', 'grown': b'abcd', 'edited': b'abd',
+    })
+    assert sorted(compare_listings(old, new)) == [
+        FileChange('added', 'A', None, 2, None, None),
+        FileChange('edited', 'M', 3, 3, None, None),
+        FileChange('gone', 'D', 1, None, None, None),
+        FileChange('grown', 'M', 2, 4, None, None),
+    ]
+    # the listing is cached next to the tarball
+    assert (tmp_path / 'old.tar.gz.members').exists()
+
+
+CONTROL = '''--- pkg-1.0.orig/debian/control
++++ pkg-1.0/debian/control
+@@ -0,0 +1,2 @@
++Source: pkg
++++ not a header
+'''
+PATCH = '''--- pkg-1.0.orig/src/main.c
++++ pkg-1.0/src/main.c
+@@ -1,2 +1,2 @@
+ int main(void)
+-bad();
++good();
+'''
+
+
+def test_diff_listing(tmp_path):
+    listing = write_diff(tmp_path / 'new.diff.gz', CONTROL + PATCH)
+    assert listing.contents == {'debian/control': b'Source: pkg\n++ not a header\n'}
+    assert list(listing.patched) == ['src/main.c']
+
+
+def test_compare_diffs(tmp_path):
+    old = write_diff(tmp_path / 'old.diff.gz', CONTROL)
+    new = write_diff(tmp_path / 'new.diff.gz', CONTROL + PATCH)
+    # an orig file patched by the newer diff is modified, not added
+    assert compare_listings(old, new) == [
+        FileChange('src/main.c', 'M', None, None, None, None),
+    ]
+
+
+def test_merge_changes():
+    assert merge_changes([
+        FileChange('b', 'D', 3, None, None, None),
+        FileChange('a', 'M', None, None, None, None),
+        FileChange('b', 'A', None, 5, None, None),
+    ]) == [
+        FileChange('a', 'M', None, None, None, None),
+        FileChange('b', 'M', 3, 5, None, None),
+    ]
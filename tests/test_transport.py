@@ -0,0 +1,102 @@
+'''tests for debcompare.transport'''
+from debcompare import transport
+from debcompare.transport import TokenBucket, Transport
+
+
+class FakeResponse:
+    '''the parts of requests.Response used by Transport'''
+
+    def __init__(self, status_code, content=b'', headers=None):
+        self.status_code = status_code
+        self._content = content
+        self.headers = headers or {}
+
+    @property
+    def content(self):
+        '''the response body'''
+        return self._content
+
+
+class FakeSession:
+    '''returns canned responses and records the request headers'''
+
+    def __init__(self, *responses):
+        self.responses = list(responses)
+        self.requests = []
+
+    def get(self, url, **kwargs):
+        '''return the next canned response'''
+        self.requests.append((url, kwargs.get('headers')))
+        return self.responses.pop(0)
+
+
+def fake_transport(tmp_path, *responses):
+    '''return a Transport caching to tmp_path and answering with responses'''
+    fake = Transport(cache_dir=str(tmp_path), rate_limits={'example.org': (1e6, 1e6)})
+    fake._session = FakeSession(*responses)  # pylint: disable=protected-access
+    return fake
+
+
+def test_token_bucket_burst(monkeypatch):
+    now = [100.0]
+    sleeps = []
+    monkeypatch.setattr(transport.time, 'monotonic', lambda: now[0])
+    monkeypatch.setattr(transport.time, 'sleep', sleeps.append)
+    bucket = TokenBucket(rate=2.0, capacity=3)
+    # the burst doesn't wait
+    assert [bucket.acquire() for _ in range(3)] == [0, 0, 0]
+    # then each token takes 1 / rate seconds
+    assert bucket.acquire() == 0.5
+    assert bucket.acquire() == 1.0
+    assert sleeps == [0.5, 1.0]
+
+
+def test_token_bucket_refill(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(transport.time, 'monotonic', lambda: now[0])
+    monkeypatch.setattr(transport.time, 'sleep', lambda seconds: None)
+    bucket = TokenBucket(rate=2.0, capacity=2)
+    bucket.acquire()
+    bucket.acquire()
+    now[0] += 10
+    # refilled up to capacity, not beyond it
+    assert [bucket.acquire() for _ in range(2)] == [0, 0]
+    assert bucket.acquire() == 0.5
+
+
+def test_get_revalidates_cache(tmp_path):
+    url = 'https://example.org/data/json'
+    fake = fake_transport(
+        tmp_path,
+        FakeResponse(200, b'{"a": 1}', {'ETag': '"v1"', 'Last-Modified': 'yesterday'}),
+        FakeResponse(304),
+    )
+    response = fake.get(url, cache=True)
+    assert (response.status_code, response.content, response.from_cache) == (
+        200, b'{"a": 1}', False)
+    assert len(list(tmp_path.iterdir())) == 2
+    response = fake.get(url, cache=True)
+    # the 304 is answered from the cache
+    assert (response.status_code, response.content, response.from_cache) == (
+        200, b'{"a": 1}', True)
+    assert fake.session.requests == [
+        (url, None),
+        (url, {'If-None-Match': '"v1"', 'If-Modified-Since': 'yesterday'}),
+    ]
+
+
+def test_get_without_validators_or_errors_is_not_cached(tmp_path):
+    url = 'https://example.org/file'
+    fake = fake_transport(
+        tmp_path,
+        FakeResponse(200, b'no validators'),
+        FakeResponse(500, b'error', {'ETag': '"v1"'}),
+        FakeResponse(200, b'not cached', {'ETag': '"v2"'}),
+    )
+    assert fake.get(url, cache=True).content == b'no validators'
+    assert fake.get(url, cache=True).status_code == 500
+    assert list(tmp_path.iterdir()) == []
+    # without cache nothing is stored even with validators
+    assert fake.get(url).content == b'not cached'
+    assert list(tmp_path.iterdir()) == []
+    assert [headers for _, headers in fake.session.requests] == [None, None, None]